@@ -6,6 +6,8 @@ from .core import AprilFoolsRenamer
 
 
 async def setup(bot: Red) -> None:
-    maybe_coro = bot.add_cog(AprilFoolsRenamer(bot))
+    cog = AprilFoolsRenamer(bot)
+    maybe_coro = bot.add_cog(cog)
     if inspect.isawaitable(maybe_coro):
         await maybe_coro
+    await cog.initialize()
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from string import Template
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import discord
+
+from .engine import AdaptiveLimiter, NickEdit, edit_nicks
+
+if TYPE_CHECKING:
+    from .core import AprilFoolsRenamer
+
+log = logging.getLogger("red.weirdjack.aprilfoolsrenamer.autorename")
+
+# how long (in seconds) to wait for more joins before renaming
+BATCH_DELAY = 1.0
+
+
+class AutoRenamer:
+    """
+    Renames joining members in batches.
+
+    Joins are queued and a single task renames everyone who joined
+    within the batch delay, sharing one rate limiter for all guilds.
+    """
+
+    def __init__(self, cog: AprilFoolsRenamer) -> None:
+        self.cog = cog
+        self.queue: asyncio.Queue[discord.Member] = asyncio.Queue()
+        self.limiter = AdaptiveLimiter()
+        # {GUILD_ID: TEMPLATE}, `None` when auto-renaming is disabled
+        self.templates: Dict[int, Optional[Template]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def add(self, member: discord.Member) -> None:
+        self.queue.put_nowait(member)
+
+    def invalidate_template(self, guild_id: int) -> None:
+        self.templates.pop(guild_id, None)
+
+    async def get_template(self, guild: discord.Guild) -> Optional[Template]:
+        try:
+            return self.templates[guild.id]
+        except KeyError:
+            pass
+        nick_template = await self.cog.config.guild(guild).nick_template()
+        tmpl = None if nick_template is None else Template(nick_template)
+        self.templates[guild.id] = tmpl
+        return tmpl
+
+    async def run(self) -> None:
+        while True:
+            members = [await self.queue.get()]
+            await asyncio.sleep(BATCH_DELAY)
+            while not self.queue.empty():
+                members.append(self.queue.get_nowait())
+            try:
+                await self._rename(members)
+            except Exception as exc:
+                log.error(
+                    "An unexpected error occurred when renaming joined members.",
+                    exc_info=exc,
+                )
+
+    async def _rename(self, members: List[discord.Member]) -> None:
+        # {GUILD_ID: {MEMBER_ID: MEMBER}}
+        by_guild: Dict[int, Dict[int, discord.Member]] = {}
+        for member in members:
+            by_guild.setdefault(member.guild.id, {})[member.id] = member
+
+        guilds: Dict[int, discord.Guild] = {}
+        edits: List[NickEdit] = []
+        for guild_id, guild_members in by_guild.items():
+            guild = next(iter(guild_members.values())).guild
+            guilds[guild_id] = guild
+            tmpl = await self.get_template(guild)
+            if tmpl is None:
+                continue
+            join_order = self.cog._get_join_order(guild)
+            for member in guild_members.values():
+                if guild.get_member(member.id) is None:
+                    # member left before we got to them
+                    continue
+                nick = tmpl.safe_substitute(index=join_order.rank(member))
+                edits.append((member, nick))
+
+        # {GUILD_ID: {MEMBER_ID: ORIGINAL_NICK}}
+        original_nicks: Dict[int, Dict[int, Optional[str]]] = {}
+
+        def callback(
+            member: discord.Member, nick: Optional[str], exc: Optional[Exception]
+        ) -> None:
+            if exc is None:
+                guild_original_nicks = original_nicks.setdefault(member.guild.id, {})
+                guild_original_nicks[member.id] = original_nick_of[member.id]
+                return
+            log.error(
+                "%s - An unexpected error occurred"
+                " when trying to edit member's nickname",
+                member,
+                exc_info=exc,
+            )
+
+        # most likely just None
+        original_nick_of = {member.id: member.nick for member, _ in edits}
+        await edit_nicks(
+            edits, reason="April Fools joke", callback=callback, limiter=self.limiter
+        )
+        for guild_id, guild_original_nicks in original_nicks.items():
+            await self.cog._save_original_nicks(
+                guilds[guild_id], guild_original_nicks, overwrite=True
+            )
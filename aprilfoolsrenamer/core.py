@@ -1,12 +1,17 @@
+import asyncio
 import logging
-from datetime import datetime
 from string import Template
+from typing import Dict, Iterable, Optional
 
 import discord
 from redbot.core import commands
 from redbot.core.bot import Red
 from redbot.core.config import Config
-from redbot.core.utils.chat_formatting import inline, pagify
+from redbot.core.utils.chat_formatting import inline
+
+from .autorename import AutoRenamer
+from .jobs import JobData, NickJob
+from .joinorder import JoinOrderIndex
 
 
 log = logging.getLogger("red.weirdjack.aprilfoolsrenamer")
@@ -19,8 +24,126 @@ class AprilFoolsRenamer(commands.Cog):
         self.config = Config.get_conf(self, 176070082584248320, force_registration=True)
         # this is `False` rather than `None`
         # because `None` is a valid value for nickname
-        self.config.register_guild(nick_template=None, rename_exclusions=[])
+        self.config.register_guild(nick_template=None, rename_exclusions=[], job=None)
         self.config.register_member(original_nick=False)
+        # {GUILD_ID: RUNNING_JOB}
+        self.jobs: Dict[int, NickJob] = {}
+        # {GUILD_ID: JOIN_ORDER_INDEX}, built on first join in the guild
+        self.join_order: Dict[int, JoinOrderIndex] = {}
+        self.auto_renamer = AutoRenamer(self)
+
+    async def initialize(self) -> None:
+        self.auto_renamer.start()
+
+        async def resume_after_ready() -> None:
+            await self.bot.wait_until_red_ready()
+            for guild_id, guild_data in (await self.config.all_guilds()).items():
+                job_data = guild_data.get("job")
+                guild = self.bot.get_guild(guild_id)
+                if job_data is None or guild is None:
+                    continue
+                log.info(
+                    "Resuming %s job in guild with ID %s.", job_data["kind"], guild_id
+                )
+                self._start_job(guild, job_data)
+
+        asyncio.create_task(resume_after_ready())
+
+    async def cog_unload(self) -> None:
+        self.auto_renamer.stop()
+        # jobs save their progress when cancelled and get resumed on next load,
+        # wait for that so that a reloaded cog doesn't resume from older progress
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start_job(self, guild: discord.Guild, job_data: JobData) -> NickJob:
+        job = NickJob(self, guild, job_data)
+        self.jobs[guild.id] = job
+
+        def _done_callback(task: asyncio.Task) -> None:
+            if self.jobs.get(guild.id) is job:
+                del self.jobs[guild.id]
+            try:
+                exc = task.exception()
+            except asyncio.CancelledError:
+                pass
+            else:
+                if exc is not None:
+                    log.error(
+                        "An unexpected error occurred in the job in guild with ID %s.",
+                        guild.id,
+                        exc_info=exc,
+                    )
+
+        job.start()
+        assert job.task is not None
+        job.task.add_done_callback(_done_callback)
+        return job
+
+    def _get_join_order(self, guild: discord.Guild) -> JoinOrderIndex:
+        join_order = self.join_order.get(guild.id)
+        # removals can get missed (e.g. members being re-chunked after reconnect),
+        # rebuild the index instead of giving out shifted indexes
+        if join_order is None or (
+            guild.member_count is not None and len(join_order) != guild.member_count
+        ):
+            join_order = self.join_order[guild.id] = JoinOrderIndex(guild.members)
+        return join_order
+
+    async def _check_no_job(self, ctx: commands.GuildContext) -> bool:
+        job = self.jobs.get(ctx.guild.id)
+        if job is None:
+            return True
+        command = inline(f"{ctx.clean_prefix}renamestatus")
+        await ctx.send(
+            "There's already a job running in this server,"
+            f" use {command} to see its progress."
+        )
+        return False
+
+    async def _save_original_nicks(
+        self,
+        guild: discord.Guild,
+        original_nicks: Dict[int, Optional[str]],
+        *,
+        overwrite: bool = False,
+    ) -> None:
+        """
+        Save original nicknames of many members with a single Config write.
+
+        Already saved original nicknames are only overwritten if `overwrite` is True.
+        """
+        if not original_nicks:
+            return
+        # DEP-WARN
+        members_group = self.config._get_base_group(Config.MEMBER, str(guild.id))
+        async with members_group.all() as members_data:
+            for member_id, original_nick in original_nicks.items():
+                member_data = members_data.setdefault(str(member_id), {})
+                if overwrite:
+                    member_data["original_nick"] = original_nick
+                else:
+                    member_data.setdefault("original_nick", original_nick)
+
+    async def _clear_original_nicks(
+        self, guild: discord.Guild, member_ids: Iterable[int]
+    ) -> None:
+        """Clear original nicknames of many members with a single Config write."""
+        member_ids = list(member_ids)
+        if not member_ids:
+            return
+        # DEP-WARN
+        members_group = self.config._get_base_group(Config.MEMBER, str(guild.id))
+        async with members_group.all() as members_data:
+            for member_id in member_ids:
+                member_data = members_data.get(str(member_id))
+                if member_data is None:
+                    continue
+                member_data.pop("original_nick", None)
+                if not member_data:
+                    del members_data[str(member_id)]
 
     @commands.guild_only()
     @commands.admin()
@@ -35,6 +158,7 @@ class AprilFoolsRenamer(commands.Cog):
         """
         if nick_template is None:
             await self.config.guild(ctx.guild).nick_template.clear()
+            self.auto_renamer.invalidate_template(ctx.guild.id)
             command = inline(f"{ctx.clean_prefix}revertnicks")
             await ctx.send(
                 "Auto-renaming disabled."
@@ -46,6 +170,7 @@ class AprilFoolsRenamer(commands.Cog):
             await ctx.send("Nickname is too long!")
             return
         await self.config.guild(ctx.guild).nick_template.set(nick_template)
+        self.auto_renamer.invalidate_template(ctx.guild.id)
         nick = tmpl.safe_substitute(index=len(ctx.guild.members))
         await ctx.send(f"Nickname template set! Here's an example nickname: {nick}")
 
@@ -72,44 +197,22 @@ class AprilFoolsRenamer(commands.Cog):
             await ctx.send("The set nickname is too long!")
             return
 
-        members = sorted(ctx.guild.members, key=lambda m: m.joined_at)
-        rename_exclusions = await self.config.guild(ctx.guild).rename_exclusions()
-
-        not_changed = []
-        async with ctx.typing():
-            for idx, member in enumerate(members, start=1):
-                nick = tmpl.safe_substitute(index=idx)
-                if member.id in rename_exclusions:
-                    not_changed.append(
-                        f"{member} (would be: {nick})"
-                        " - Member is set to be excluded from renaming."
-                    )
-                    continue
-                if (
-                    member.top_role >= ctx.guild.me.top_role
-                    and member is not ctx.guild.me
-                ):
-                    not_changed.append(
-                        f"{member} (would be: {nick})"
-                        " - Member's top role is not lower than mine."
-                    )
-                    continue
-                original_nick = member.nick
-                try:
-                    await member.edit(nick=nick, reason="April Fools joke")
-                except discord.HTTPException as exc:
-                    not_changed.append(
-                        f"{member} (would be: {nick}) - An unexpected error occurred"
-                        f" when trying to edit member's nickname: {exc}"
-                    )
-                else:
-                    await self.config.member(member).original_nick.set(original_nick)
+        if not await self._check_no_job(ctx):
+            return
 
-        msg = "Nicknames updated!\n"
-        if not_changed:
-            msg += "Nicknames of these users have not been updated:\n"
-            msg += "\n".join(not_changed)
-        await ctx.send(msg)
+        job_data: JobData = {
+            "kind": "rename",
+            "channel_id": ctx.channel.id,
+            "total": len(ctx.guild.members),
+            "position": 0,
+            "last_key": None,
+        }
+        self._start_job(ctx.guild, job_data)
+        command = inline(f"{ctx.clean_prefix}renamestatus")
+        await ctx.send(
+            "Renaming started, I'll send a message here once it's done."
+            f" Use {command} to see its progress."
+        )
 
     @commands.guild_only()
     @commands.admin()
@@ -118,38 +221,33 @@ class AprilFoolsRenamer(commands.Cog):
         """
         Reset everyone's nicknames to what they were before `[p]renameall` command was used.
         """
-        not_changed = []
-        async with ctx.typing():
-            for member in ctx.guild.members:
-                original_nick = await self.config.member(member).original_nick()
-                if original_nick is False:
-                    continue
-                if (
-                    member.top_role >= ctx.guild.me.top_role
-                    and member is not ctx.guild.me
-                ):
-                    not_changed.append(
-                        f"{member} - Member's top role is not lower than mine."
-                    )
-                    continue
-                try:
-                    await member.edit(
-                        nick=original_nick, reason="Revert April Fools joke"
-                    )
-                except discord.HTTPException as exc:
-                    not_changed.append(
-                        f"{member} - An unexpected error occurred"
-                        f" when trying to edit member's nickname: {exc}"
-                    )
-                else:
-                    await self.config.member(member).original_nick.clear()
+        if not await self._check_no_job(ctx):
+            return
 
-        msg = "Nicknames updated!\n"
-        if not_changed:
-            msg += "Nicknames of these users have not been updated:\n"
-            msg += "\n".join(not_changed)
-        for page in pagify(msg):
-            await ctx.send(page)
+        job_data: JobData = {
+            "kind": "reset",
+            "channel_id": ctx.channel.id,
+            "total": 0,
+            "position": 0,
+            "last_key": None,
+        }
+        self._start_job(ctx.guild, job_data)
+        command = inline(f"{ctx.clean_prefix}renamestatus")
+        await ctx.send(
+            "Resetting nicknames started, I'll send a message here once it's done."
+            f" Use {command} to see its progress."
+        )
+
+    @commands.guild_only()
+    @commands.admin()
+    @commands.command()
+    async def renamestatus(self, ctx: commands.GuildContext) -> None:
+        """Show progress of the running `[p]renameall` or `[p]resetnicks`."""
+        job = self.jobs.get(ctx.guild.id)
+        if job is None:
+            await ctx.send("There's no job running in this server.")
+            return
+        await ctx.send(job.get_progress())
 
     @commands.guild_only()
     @commands.admin()
@@ -179,28 +277,26 @@ class AprilFoolsRenamer(commands.Cog):
             rename_exclusions.remove(member.id)
         await ctx.send("The given member is now included in renaming.")
 
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        join_order = self.join_order.get(member.guild.id)
+        if join_order is not None:
+            join_order.remove(member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        # member list may have been replaced without any remove events
+        self.join_order.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.join_order.pop(guild.id, None)
+        self.auto_renamer.invalidate_template(guild.id)
+
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
-        nick_template = await self.config.guild(member.guild).nick_template()
-        if nick_template is None:
-            return
-        tmpl = Template(nick_template)
-        idx = (
-            sorted(
-                member.guild.members, key=lambda m: m.joined_at or datetime.now()
-            ).index(member)
-            + 1
-        )
-        original_nick = member.nick  # most likely just None
-        nick = tmpl.safe_substitute(index=idx)
-        try:
-            await member.edit(nick=nick, reason="April Fools joke")
-        except discord.HTTPException as exc:
-            log.error(
-                "%s - An unexpected error occurred"
-                " when trying to edit member's nickname",
-                member,
-                exc_info=exc,
-            )
-        else:
-            await self.config.member(member).original_nick.set(original_nick)
+        join_order = self.join_order.get(member.guild.id)
+        if join_order is not None:
+            # keep the index up-to-date even when auto-renaming is disabled
+            join_order.add(member)
+        self.auto_renamer.add(member)
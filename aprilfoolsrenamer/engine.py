@@ -0,0 +1,92 @@
+import asyncio
+from typing import Callable, Iterable, Optional, Tuple
+
+import discord
+
+# (MEMBER, NEW_NICK)
+NickEdit = Tuple[discord.Member, Optional[str]]
+# called with the member, the nick it was supposed to get
+# and the exception if the edit failed
+ResultCallback = Callable[[discord.Member, Optional[str], Optional[Exception]], None]
+
+MAX_ATTEMPTS = 3
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for member edits.
+
+    The limit is halved whenever we get rate limited
+    and grows back by one after that many successful edits in a row.
+    """
+
+    def __init__(self, initial: int = 5, maximum: int = 10) -> None:
+        self.limit = initial
+        self.maximum = maximum
+        self._active = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def __aexit__(self, *args: object) -> None:
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def on_rate_limited(self) -> None:
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+async def _edit_nick(
+    member: discord.Member, nick: Optional[str], reason: str, limiter: AdaptiveLimiter
+) -> Optional[Exception]:
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        async with limiter:
+            try:
+                await member.edit(nick=nick, reason=reason)
+            except discord.HTTPException as exc:
+                # discord.py already retries on 429 so we only see it if it gave up
+                if exc.status == 429 and attempt < MAX_ATTEMPTS:
+                    limiter.on_rate_limited()
+                    continue
+                return exc
+        limiter.on_success()
+        return None
+    raise RuntimeError("unreachable")
+
+
+async def edit_nicks(
+    edits: Iterable[NickEdit],
+    *,
+    reason: str,
+    callback: ResultCallback,
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> None:
+    """
+    Edit nicknames of many members concurrently.
+
+    `callback` is called after each edit, in the order in which the edits finish.
+    """
+    if limiter is None:
+        limiter = AdaptiveLimiter()
+    edits_iter = iter(edits)
+
+    # a fixed amount of workers rather than a task per member,
+    # the limiter decides how many of them can edit at once
+    async def worker() -> None:
+        for member, nick in edits_iter:
+            exc = await _edit_nick(member, nick, reason, limiter)
+            callback(member, nick, exc)
+
+    await asyncio.gather(*(worker() for _ in range(limiter.maximum)))
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_right
+from string import Template
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+)
+
+import discord
+from redbot.core.utils.chat_formatting import humanize_timedelta, pagify
+
+from .engine import NickEdit, edit_nicks
+from .joinorder import JoinKey, get_join_key
+
+if TYPE_CHECKING:
+    from .core import AprilFoolsRenamer
+
+log = logging.getLogger("red.weirdjack.aprilfoolsrenamer.jobs")
+
+# how often (in seconds) the job's progress is saved
+CHECKPOINT_INTERVAL = 15.0
+
+# (POSITION, MEMBER, NEW_NICK)
+PlannedEdit = Tuple[int, discord.Member, Optional[str]]
+
+
+class JobData(TypedDict):
+    # "rename" or "reset"
+    kind: str
+    channel_id: int
+    # number of members in the plan and how many of them were fully handled
+    total: int
+    position: int
+    # join key (as a list) of the last handled member when renaming,
+    # list indexes would shift if someone joined or left before resuming
+    last_key: Optional[List]
+
+
+class NickJob:
+    """
+    Rename or reset job that runs in the background.
+
+    The job's progress is periodically saved to Config
+    so that the job can be resumed after a restart.
+    Original nicknames are saved before renaming anyone
+    so they're never lost, even if the bot crashes mid-job.
+    """
+
+    def __init__(
+        self, cog: AprilFoolsRenamer, guild: discord.Guild, data: JobData
+    ) -> None:
+        self.cog = cog
+        self.guild = guild
+        self.data = data
+        self.not_changed: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self._resumed_at = time.monotonic()
+        self._resumed_position = data["position"]
+        self._next_position = data["position"]
+        # {MEMBER_ID: POSITION}
+        self._in_flight: Dict[int, int] = {}
+        # join keys of the planned members (in plan order) when renaming
+        self._keys: List[JoinKey] = []
+        # restored members that need to be cleared from Config at next checkpoint
+        self._restored: List[int] = []
+
+    @property
+    def kind(self) -> str:
+        return self.data["kind"]
+
+    @property
+    def position(self) -> int:
+        """Number of members from the start of the plan that were fully handled."""
+        if self._in_flight:
+            return min(self._in_flight.values())
+        return self._next_position
+
+    def get_progress(self) -> str:
+        total = self.data["total"]
+        position = self.position
+        action = "Renaming" if self.kind == "rename" else "Resetting nicknames"
+        msg = f"{action}: {position}/{total} members"
+        if total:
+            msg += f" ({position / total:.1%})"
+        handled = position - self._resumed_position
+        elapsed = time.monotonic() - self._resumed_at
+        if handled > 0 and elapsed > 0:
+            eta = (total - position) * elapsed / handled
+            msg += f", ETA: {humanize_timedelta(seconds=max(int(eta), 1))}"
+        return msg
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def _plan_rename(self) -> List[PlannedEdit]:
+        guild = self.guild
+        nick_template = await self.cog.config.guild(guild).nick_template()
+        if nick_template is None:
+            self.not_changed.append(
+                "Nickname template was unset before the renaming finished."
+            )
+            return []
+        tmpl = Template(nick_template)
+        rename_exclusions = await self.cog.config.guild(guild).rename_exclusions()
+        keyed_members = sorted(
+            ((get_join_key(member), member) for member in guild.members),
+            key=lambda item: item[0],
+        )
+        self._keys = [key for key, _ in keyed_members]
+        last_key = self.data.get("last_key")
+        start = 0 if last_key is None else bisect_right(self._keys, tuple(last_key))
+        self.data["total"] = len(keyed_members)
+        self.data["position"] = self._resumed_position = self._next_position = start
+
+        planned = []
+        original_nicks: Dict[int, Optional[str]] = {}
+        for position in range(start, len(keyed_members)):
+            member = keyed_members[position][1]
+            nick = tmpl.safe_substitute(index=position + 1)
+            if member.id in rename_exclusions:
+                self.not_changed.append(
+                    f"{member} (would be: {nick})"
+                    " - Member is set to be excluded from renaming."
+                )
+                continue
+            if member.top_role >= guild.me.top_role and member is not guild.me:
+                self.not_changed.append(
+                    f"{member} (would be: {nick})"
+                    " - Member's top role is not lower than mine."
+                )
+                continue
+            if member.nick == nick:
+                # already renamed before the job got interrupted
+                continue
+            planned.append((position, member, nick))
+            original_nicks[member.id] = member.nick
+        # write-ahead, already saved original nicknames (e.g. of members
+        # that were renamed before the job got interrupted) are kept as is
+        await self.cog._save_original_nicks(guild, original_nicks)
+        return planned
+
+    async def _plan_reset(self) -> List[PlannedEdit]:
+        guild = self.guild
+        to_reset = []
+        # only members with some stored data are included, so no per-member reads
+        members_data = await self.cog.config.all_members(guild)
+        for member_id, member_data in members_data.items():
+            original_nick = member_data["original_nick"]
+            if original_nick is False:
+                continue
+            member = guild.get_member(member_id)
+            if member is None:
+                continue
+            if member.top_role >= guild.me.top_role and member is not guild.me:
+                self.not_changed.append(
+                    f"{member} - Member's top role is not lower than mine."
+                )
+                continue
+            to_reset.append((member, original_nick))
+        # restored nicknames are cleared from Config at each checkpoint,
+        # so after resuming the plan only consists of the remaining members
+        self.data["total"] = len(to_reset)
+        self.data["position"] = self._resumed_position = self._next_position = 0
+        return [
+            (position, member, original_nick)
+            for position, (member, original_nick) in enumerate(to_reset)
+        ]
+
+    def _track(self, planned: Iterable[PlannedEdit]) -> Iterator[NickEdit]:
+        for position, member, nick in planned:
+            self._in_flight[member.id] = position
+            self._next_position = position + 1
+            yield member, nick
+        self._next_position = self.data["total"]
+
+    def _on_result(
+        self, member: discord.Member, nick: Optional[str], exc: Optional[Exception]
+    ) -> None:
+        del self._in_flight[member.id]
+        if exc is not None:
+            would_be = f" (would be: {nick})" if self.kind == "rename" else ""
+            self.not_changed.append(
+                f"{member}{would_be} - An unexpected error occurred"
+                f" when trying to edit member's nickname: {exc}"
+            )
+        elif self.kind == "reset":
+            self._restored.append(member.id)
+
+    async def checkpoint(self) -> None:
+        restored, self._restored = self._restored, []
+        await self.cog._clear_original_nicks(self.guild, restored)
+        position = self.position
+        self.data["position"] = position
+        if self.kind == "rename" and position:
+            self.data["last_key"] = list(self._keys[position - 1])
+        await self.cog.config.guild(self.guild).job.set(self.data)
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            await self.checkpoint()
+
+    async def run(self) -> None:
+        try:
+            await self._run()
+        except Exception:
+            # don't resume a job that failed on every load
+            await self.cog.config.guild(self.guild).job.clear()
+            await self._send_report(
+                "The job failed due to an unexpected error, check your logs."
+            )
+            raise
+        msg = "Nicknames updated!\n"
+        if self.not_changed:
+            msg += "Nicknames of these users have not been updated:\n"
+            msg += "\n".join(self.not_changed)
+        await self._send_report(msg)
+
+    async def _run(self) -> None:
+        # saved here rather than by the command so that the job is registered
+        # (and concurrent commands see it) before anything gets awaited
+        await self.cog.config.guild(self.guild).job.set(self.data)
+        if self.kind == "rename":
+            planned = await self._plan_rename()
+            reason = "April Fools joke"
+        else:
+            planned = await self._plan_reset()
+            reason = "Revert April Fools joke"
+
+        checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+        try:
+            await edit_nicks(
+                self._track(planned), reason=reason, callback=self._on_result
+            )
+        finally:
+            checkpoint_task.cancel()
+            # this also runs when the job is cancelled due to cog unload
+            await self.checkpoint()
+        await self.cog.config.guild(self.guild).job.clear()
+
+    async def _send_report(self, msg: str) -> None:
+        channel = self.guild.get_channel(self.data["channel_id"])
+        if channel is None:
+            return
+        try:
+            for page in pagify(msg):
+                await channel.send(page)
+        except discord.HTTPException as exc:
+            log.error(
+                "Could not send the job's report in guild with ID %s.",
+                self.guild.id,
+                exc_info=exc,
+            )
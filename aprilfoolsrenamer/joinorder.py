@@ -0,0 +1,50 @@
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+import discord
+
+# (JOINED_AT_TIMESTAMP, MEMBER_ID)
+JoinKey = Tuple[float, int]
+
+
+def get_join_key(member: discord.Member) -> JoinKey:
+    # `joined_at` can be missing, such members are treated as the newest ones
+    joined_at = member.joined_at.timestamp() if member.joined_at else time.time()
+    return joined_at, member.id
+
+
+class JoinOrderIndex:
+    """
+    Members of a guild ordered by their join date.
+
+    Rank queries are a binary search, adding and removing a member only
+    shifts the keys after it (a single memmove) instead of sorting all members.
+    """
+
+    def __init__(self, members: Iterable[discord.Member]) -> None:
+        # {MEMBER_ID: JOIN_KEY}
+        self._keys: Dict[int, JoinKey] = {
+            member.id: get_join_key(member) for member in members
+        }
+        self._sorted: List[JoinKey] = sorted(self._keys.values())
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def add(self, member: discord.Member) -> None:
+        if member.id in self._keys:
+            return
+        key = self._keys[member.id] = get_join_key(member)
+        insort(self._sorted, key)
+
+    def remove(self, member_id: int) -> None:
+        key = self._keys.pop(member_id, None)
+        if key is None:
+            return
+        del self._sorted[bisect_left(self._sorted, key)]
+
+    def rank(self, member: discord.Member) -> int:
+        """Get member's (1-based) position on the members list sorted by join date."""
+        self.add(member)
+        return bisect_left(self._sorted, self._keys[member.id]) + 1
@@ -1,3 +1,6 @@
+import json
+import logging
+import os
 from typing import Optional
 
 from redbot.core import commands, data_manager
@@ -5,25 +8,81 @@ from redbot.core.bot import Red
 from redbot.core.utils.chat_formatting import inline
 
 
+log = logging.getLogger("red.weirdjack.choosebot")
+
+
+def _get_instance_name() -> str:
+    instance_name = (
+        data_manager.instance_name()
+        if callable(data_manager.instance_name)
+        else data_manager.instance_name
+    )
+    assert isinstance(instance_name, str)
+    return instance_name
+
+
 class ChooseBot(commands.Cog):
     def __init__(self, bot: Red) -> None:
         self.bot = bot
         self.chosen_bot: Optional[str] = None
+        # instance name can't change without a restart
+        self.instance_name = _get_instance_name()
+        # the choice is shared with other instances on this host through a file
+        # in Red's config directory (the one with the list of all instances)
+        self.choice_path = data_manager.config_dir / "choosebot.json"
+        self._choice_mtime: Optional[int] = None
+        self._sync_choice()
+
+    def _sync_choice(self) -> None:
+        """Reload the shared choice if another instance has changed it."""
+        # on any error, the last known choice is kept
+        try:
+            mtime = os.stat(self.choice_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        except OSError as exc:
+            log.error("Could not access the shared instance choice.", exc_info=exc)
+            return
+        if mtime == self._choice_mtime:
+            return
+        try:
+            with self.choice_path.open(encoding="utf-8") as fp:
+                chosen_bot = json.load(fp)["chosen_bot"]
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            log.error("Could not read the shared instance choice.", exc_info=exc)
+            return
+        # remember the mtime either way so that a bad file is only reported once
+        self._choice_mtime = mtime
+        if chosen_bot is not None and not isinstance(chosen_bot, str):
+            log.error(
+                "The shared instance choice is invalid (%r), ignoring it.", chosen_bot
+            )
+            return
+        self.chosen_bot = chosen_bot
+
+    def _broadcast_choice(self, instance_name: str) -> None:
+        tmp_path = self.choice_path.with_name(
+            f"{self.choice_path.name}.{self.instance_name}.tmp"
+        )
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            json.dump({"chosen_bot": instance_name}, fp)
+        # atomic, other instances will never see a partially written file
+        os.replace(tmp_path, self.choice_path)
+        self._choice_mtime = os.stat(self.choice_path).st_mtime_ns
 
     async def bot_check_once(self, ctx: commands.Context) -> bool:
-        if ctx.command is self.choosebot:
+        # this runs before every command so the common case has to be cheap,
+        # `owner_ids` is the same set that `Red.is_owner()` checks
+        if ctx.author.id not in self.bot.owner_ids:
             return True
 
-        instance_name = (
-            data_manager.instance_name()
-            if callable(data_manager.instance_name)
-            else data_manager.instance_name
-        )
-        assert isinstance(instance_name, str)
-        if self.chosen_bot == instance_name:
+        if ctx.command is self.choosebot:
             return True
 
-        if not await self.bot.is_owner(ctx.author):
+        # a single stat() call, only made for owners
+        self._sync_choice()
+        instance_name = self.instance_name
+        if self.chosen_bot == instance_name:
             return True
 
         if self.chosen_bot is None:
@@ -41,8 +100,24 @@ class ChooseBot(commands.Cog):
     @commands.is_owner()
     @commands.command()
     async def choosebot(self, ctx: commands.Context, instance_name: str) -> None:
+        """
+        Choose the instance that should respond to owner's commands.
+
+        The choice is shared with all other instances on this machine
+        that have this cog loaded and is kept across restarts.
+        """
         self.chosen_bot = instance_name
+        try:
+            self._broadcast_choice(instance_name)
+        except OSError as exc:
+            log.error("Could not share the instance choice.", exc_info=exc)
+            await ctx.send(
+                f"[{self.instance_name}] Usage of the instance with name"
+                f" {inline(instance_name)} will now be enforced but I couldn't"
+                " share that choice with other instances, check your logs."
+            )
+            return
         await ctx.send(
-            f"[{data_manager.instance_name}] Usage of the instance with name"
-            f" {inline(instance_name)} will now be enforced."
+            f"[{self.instance_name}] Usage of the instance with name"
+            f" {inline(instance_name)} will now be enforced on all instances."
         )
@@ -1,16 +1,27 @@
 import asyncio
 import datetime
+import heapq
 import logging
-import math
-import random
 import time
-from typing import TYPE_CHECKING, Dict, List, Optional, TypedDict, Union
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import discord
 from redbot.core import commands
 from redbot.core.bot import Red
 from redbot.core.config import Config
-from redbot.core.utils.chat_formatting import humanize_timedelta
+from redbot.core.utils.chat_formatting import box, humanize_timedelta
+
+from .members import EligibleMembers
+from .stats import SchedulerStats
 
 
 MessageableGuildChannelOrThread = Union[
@@ -22,6 +33,12 @@ MessageableGuildChannelOrThread = Union[
 
 log = logging.getLogger("red.weirdjack.constantrandompings")
 
+# discord.py already takes care of per-route rate limits,
+# this just makes sure that a lot of due guilds don't all hit the API at once
+MAX_CONCURRENT_PINGS = 10
+# how often (in seconds) the buffered settings changes are written to Config
+CONFIG_FLUSH_INTERVAL = 30.0
+
 
 class GuildConfig(TypedDict):
     enabled: bool
@@ -50,27 +67,44 @@ class ConstantRandomPings(commands.Cog):
         self.config.register_guild(enabled=False, interval=300.0, channel=None)
         self.guilds: Dict[int, GuildConfig] = {}
         self.last_ping: Dict[int, float] = {}
-        self.loop = asyncio.get_running_loop()
+        # heap of (NEXT_PING, GUILD_ID), entries not matching `self.next_ping` are stale
+        self._schedule: List[Tuple[float, int]] = []
+        self.next_ping: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        # guilds that are being pinged right now, rescheduled once that's done
+        self._pinging: Set[int] = set()
+        self._ping_semaphore = asyncio.Semaphore(MAX_CONCURRENT_PINGS)
+        self._ping_tasks: Set[asyncio.Task] = set()
+        # built lazily on first ping, kept up-to-date with member and role events
+        self._eligible_members: Dict[int, EligibleMembers] = {}
+        self.stats = SchedulerStats()
+        # {GUILD_ID: GUILD_CONFIG} - changes that weren't written to Config yet
+        self._pending_writes: Dict[int, GuildConfig] = {}
+        self._flush_task: Optional[asyncio.Task] = None
         self.task: Optional[asyncio.Task] = None
-        self.handle: Optional[asyncio.TimerHandle] = None
-        self._schedule_next = True
 
     async def initialize(self) -> None:
         self.guilds = await self.config.all_guilds()
+        self._flush_task = asyncio.create_task(self._flush_config_loop())
 
-        async def schedule_after_ready() -> None:
+        async def start_after_ready() -> None:
             await self.bot.wait_until_ready()
-            self.schedule_ping_people_task()
+            for guild_id in self.guilds:
+                self.schedule_guild(guild_id)
+            self.start_scheduler_task()
 
-        asyncio.create_task(schedule_after_ready())
+        asyncio.create_task(start_after_ready())
 
     async def cog_unload(self) -> None:
         if self.task is not None:
             self.task.cancel()
             self.task = None
-        if self.handle is not None:
-            self.handle.cancel()
-            self.handle = None
+        for task in self._ping_tasks:
+            task.cancel()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush_config()
 
     async def _ensure_config_for_guild(self, guild: discord.Guild) -> None:
         if guild.id in self.guilds:
@@ -83,15 +117,49 @@ class ConstantRandomPings(commands.Cog):
             return guild_config
         return await self.config.guild(guild).all()
 
+    def _mark_dirty(self, guild_id: int) -> None:
+        self._pending_writes[guild_id] = self.guilds[guild_id]
+
+    async def flush_config(self) -> None:
+        """Write all buffered settings changes to Config."""
+        # entries are only removed once written so that nothing gets lost
+        # if the flush fails or gets cancelled (e.g. by cog unload) midway
+        for guild_id in list(self._pending_writes):
+            guild_config = self._pending_writes.get(guild_id)
+            if guild_config is None:
+                continue
+            value = dict(guild_config)
+            try:
+                await self.config.guild_from_id(guild_id).set(value)
+            except Exception as exc:
+                log.error(
+                    "Could not save settings of guild with ID %s.",
+                    guild_id,
+                    exc_info=exc,
+                )
+                # retry on next flush
+                continue
+            current = self._pending_writes.get(guild_id)
+            if current is not None and dict(current) == value:
+                # no newer change was made while writing
+                del self._pending_writes[guild_id]
+
+    async def _flush_config_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CONFIG_FLUSH_INTERVAL)
+            await self.flush_config()
+
+    # the setters only change the cached settings and schedule a Config write,
+    # this way the ping tasks never have to wait for storage
     async def set_guild_enabled(self, guild: discord.Guild, value: bool) -> None:
         await self._ensure_config_for_guild(guild)
         self.guilds[guild.id]["enabled"] = value
-        await self.config.guild(guild).enabled.set(value)
+        self._mark_dirty(guild.id)
 
     async def set_guild_interval(self, guild: discord.Guild, value: float) -> None:
         await self._ensure_config_for_guild(guild)
         self.guilds[guild.id]["interval"] = value
-        await self.config.guild(guild).interval.set(value)
+        self._mark_dirty(guild.id)
 
     async def set_guild_channel(
         self,
@@ -101,26 +169,37 @@ class ConstantRandomPings(commands.Cog):
         await self._ensure_config_for_guild(guild)
         value = channel_or_thread and channel_or_thread.id
         self.guilds[guild.id]["channel"] = value
-        await self.config.guild(guild).channel.set(value)
+        self._mark_dirty(guild.id)
+
+    def schedule_guild(self, guild_id: int, next_ping: Optional[float] = None) -> None:
+        """
+        (Re)schedule the next ping for the guild based on its current config.
 
-    async def reschedule_ping_people_task(self) -> None:
-        if not self._schedule_next:
+        This only touches the given guild's entry, others are left as they were.
+        """
+        if guild_id in self._pinging:
+            # up-to-date config will be used once the ping finishes
+            return
+        guild_config = self.guilds.get(guild_id)
+        if (
+            guild_config is None
+            or not guild_config["enabled"]
+            or guild_config["channel"] is None
+        ):
+            # any entry that is still in the heap is now stale
+            self.next_ping.pop(guild_id, None)
             return
-        log.info("Settings changed, rescheduling task...")
-        if self.task is not None:
-            # task is currently running, disable scheduling and wait
-            log.info(
-                "Task is already running, waiting for reschedule until it finishes."
-            )
-            self._schedule_next = False
-            await self.task
-            self._schedule_next = True
 
-        if self.handle is not None:
-            self.handle.cancel()
-        self.schedule_ping_people_task()
+        if next_ping is None:
+            last_ping = self.last_ping.setdefault(guild_id, time.time())
+            next_ping = last_ping + guild_config["interval"]
+        self.next_ping[guild_id] = next_ping
+        heapq.heappush(self._schedule, (next_ping, guild_id))
+        if self._schedule[0] == (next_ping, guild_id):
+            # the scheduler is sleeping until a later time, wake it up
+            self._wakeup.set()
 
-    def schedule_ping_people_task(self) -> None:
+    def start_scheduler_task(self) -> None:
         def _done_callback(task: asyncio.Task) -> None:
             self.task = None
             try:
@@ -135,110 +214,217 @@ class ConstantRandomPings(commands.Cog):
                     exc_info=exc,
                 )
 
-        self.task = asyncio.create_task(self.ping_people())
+        self.task = asyncio.create_task(self.run_scheduler())
         self.task.add_done_callback(_done_callback)
 
-    async def ping_people(self) -> None:
-        log.debug("Starting ping people task...")
-        self.handle = None
-        guilds_to_remove: List[int] = []
-
-        current_time = time.time()
-        new_task_start = math.inf
-        for guild_id, guild_config in self.guilds.items():
-            if not guild_config["enabled"]:
-                continue
-            channel_id = guild_config["channel"]
-            if channel_id is None:
+    async def run_scheduler(self) -> None:
+        log.debug("Starting ping scheduler...")
+        while True:
+            self._wakeup.clear()
+            # drop stale entries
+            while self._schedule:
+                next_ping, guild_id = self._schedule[0]
+                if self.next_ping.get(guild_id) == next_ping:
+                    break
+                heapq.heappop(self._schedule)
+
+            if not self._schedule:
+                log.debug("No guild requires scheduling a ping, waiting...")
+                await self._wakeup.wait()
                 continue
 
-            last_ping = self.last_ping.setdefault(guild_id, current_time)
-            next_ping = last_ping + guild_config["interval"]
-            if next_ping > current_time:
-                # interval didn't pass
-                new_task_start = min(next_ping, new_task_start)
-                log.debug(
-                    "Interval for guild with ID %s did not pass yet, skipping...",
-                    guild_id,
-                )
+            next_ping, guild_id = self._schedule[0]
+            delay = next_ping - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                # either it's time or the schedule changed, check again
                 continue
 
-            guild = self.bot.get_guild(guild_id)
-            if guild is None:
-                # assume guild is unavailable but don't permanently remove its config
-                guilds_to_remove.append(guild_id)
-                log.warning(
-                    "Could not find guild with ID %s, ignoring until cog reload...",
-                    guild_id,
-                )
-                continue
+            heapq.heappop(self._schedule)
+            del self.next_ping[guild_id]
+            self._pinging.add(guild_id)
+            # don't wait for it, other due guilds shouldn't be delayed by this one
+            task = asyncio.create_task(self._run_ping(guild_id, next_ping))
+            self._ping_tasks.add(task)
+            task.add_done_callback(self._ping_tasks.discard)
+
+    async def _run_ping(self, guild_id: int, due: float) -> None:
+        start = time.perf_counter()
+        try:
+            async with self._ping_semaphore:
+                await self.ping_guild(guild_id, due)
+        except Exception as exc:
+            log.error(
+                "An unexpected error occurred when pinging in guild with ID %s.",
+                guild_id,
+                exc_info=exc,
+            )
+        finally:
+            self._pinging.discard(guild_id)
+            self.stats.record_run(time.perf_counter() - start)
+        if guild_id in self.guilds:
+            self._schedule_next_ping(guild_id, due)
+
+    async def ping_guild(self, guild_id: int, due: float) -> None:
+        # the guild may have been disabled while this ping was waiting for its turn
+        guild_config = self.guilds.get(guild_id)
+        if guild_config is None or not guild_config["enabled"]:
+            return
+        channel_id = guild_config["channel"]
+        if channel_id is None:
+            return
 
-            if guild.unavailable:
-                log.warning("Guild with ID %s is unavailable, skipping...", guild_id)
-                continue
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            # assume guild is unavailable but don't permanently remove its config
+            del self.guilds[guild_id]
+            log.warning(
+                "Could not find guild with ID %s, ignoring until cog reload...",
+                guild_id,
+            )
+            return
 
-            channel_or_thread = guild.get_channel_or_thread(channel_id)
-            if channel_or_thread is None:
-                # the channel no longer exists, unset in config
-                await self.set_guild_channel(guild, None)
-                log.warning(
-                    "Channel or thread with ID %s no longer exists,"
-                    " unsetting the value in configuration of guild with ID %s.",
-                    channel_id,
-                    guild_id,
-                )
-                continue
+        if guild.unavailable:
+            log.warning("Guild with ID %s is unavailable, skipping...", guild_id)
+            return
 
-            # we can ping new users into the thread
-            channel = (
-                channel_or_thread.parent
-                if isinstance(channel_or_thread, discord.Thread)
-                else channel_or_thread
+        channel_or_thread = guild.get_channel_or_thread(channel_id)
+        if channel_or_thread is None:
+            # the channel no longer exists, unset in config
+            await self.set_guild_channel(guild, None)
+            log.warning(
+                "Channel or thread with ID %s no longer exists,"
+                " unsetting the value in configuration of guild with ID %s.",
+                channel_id,
+                guild_id,
             )
-            me = guild.me
-            members = [
-                m for m in guild.members if channel.permissions_for(me).send_messages
-            ]
-            member_to_ping = random.choice(members)
-            try:
-                if not channel_or_thread.permissions_for(me).send_messages:
-                    raise RuntimeError
-                await channel_or_thread.send(member_to_ping.mention)
-            except (discord.Forbidden, RuntimeError):
-                # missing send permissions, disable without unsetting the channel
-                await self.set_guild_enabled(guild, False)
-                log.warning(
-                    "Missing send permissions in channel or thread with ID %s,"
-                    " disabled constant random pings for guild with ID %s.",
-                    channel_id,
-                    guild_id,
-                )
-                continue
-            except discord.HTTPException as exc:
-                # unexpected HTTP exception, ignore...
-                log.warning(
-                    "Could not send message in channel or thread with ID %s"
-                    " (from guild with ID %s) due to HTTP exception.",
-                    channel_id,
-                    guild_id,
-                    exc_info=exc,
-                )
-
-            last_ping = self.last_ping[guild_id] = time.time()
-            next_ping = last_ping + guild_config["interval"]
-            new_task_start = min(next_ping, new_task_start)
+            return
 
-        for guild_id in guilds_to_remove:
-            del self.guilds[guild_id]
+        # we can ping new users into the thread
+        channel = (
+            channel_or_thread.parent
+            if isinstance(channel_or_thread, discord.Thread)
+            else channel_or_thread
+        )
+        me = guild.me
+        member_to_ping = self._pick_member(guild, channel)
+        if member_to_ping is None:
+            log.warning(
+                "No member can see the channel with ID %s (from guild with ID %s),"
+                " skipping...",
+                channel.id,
+                guild_id,
+            )
+            return
+        try:
+            if not channel_or_thread.permissions_for(me).send_messages:
+                raise RuntimeError
+            send_start = time.perf_counter()
+            lateness = time.time() - due
+            await channel_or_thread.send(member_to_ping.mention)
+            self.stats.record_send(
+                guild_id, lateness, time.perf_counter() - send_start
+            )
+        except (discord.Forbidden, RuntimeError):
+            # missing send permissions, disable without unsetting the channel
+            await self.set_guild_enabled(guild, False)
+            log.warning(
+                "Missing send permissions in channel or thread with ID %s,"
+                " disabled constant random pings for guild with ID %s.",
+                channel_id,
+                guild_id,
+            )
+            return
+        except discord.HTTPException as exc:
+            # unexpected HTTP exception, ignore...
+            log.warning(
+                "Could not send message in channel or thread with ID %s"
+                " (from guild with ID %s) due to HTTP exception.",
+                channel_id,
+                guild_id,
+                exc_info=exc,
+            )
 
-        log.debug("Ping people task finished.")
-        if not self._schedule_next or new_task_start is math.inf:
-            log.info("No guild requires scheduling a new task, returning...")
-            # nothing needs to happen in the future
+        self.last_ping[guild_id] = time.time()
+
+    def _pick_member(
+        self, guild: discord.Guild, channel: discord.abc.GuildChannel
+    ) -> Optional[discord.Member]:
+        eligible = self._eligible_members.get(guild.id)
+        if eligible is None or eligible.channel_id != channel.id:
+            eligible = EligibleMembers.build(channel, guild.members)
+            self._eligible_members[guild.id] = eligible
+        while True:
+            member_id = eligible.choice()
+            if member_id is None:
+                return None
+            member = guild.get_member(member_id)
+            # the index should be up-to-date but verifying a single member is cheap
+            if member is not None and channel.permissions_for(member).view_channel:
+                return member
+            eligible.discard(member_id)
+
+    def _get_eligible_channel(
+        self, guild: discord.Guild
+    ) -> Optional[discord.abc.GuildChannel]:
+        eligible = self._eligible_members.get(guild.id)
+        if eligible is None:
+            return None
+        channel = guild.get_channel(eligible.channel_id)
+        if channel is None:
+            del self._eligible_members[guild.id]
+        return channel
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        channel = self._get_eligible_channel(member.guild)
+        if channel is not None:
+            self._eligible_members[member.guild.id].update(channel, member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        eligible = self._eligible_members.get(member.guild.id)
+        if eligible is not None:
+            eligible.discard(member.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(
+        self, before: discord.Member, after: discord.Member
+    ) -> None:
+        if before.roles == after.roles:
             return
-        delta = max(new_task_start - time.time(), 0.0) + 5.0
-        log.info("Next task will be started in %s seconds.", delta)
-        self.loop.call_later(delta, self.schedule_ping_people_task)
+        channel = self._get_eligible_channel(after.guild)
+        if channel is not None:
+            self._eligible_members[after.guild.id].update(channel, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(
+        self, before: discord.Role, after: discord.Role
+    ) -> None:
+        if before.permissions != after.permissions:
+            self._eligible_members.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        self._eligible_members.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ) -> None:
+        eligible = self._eligible_members.get(after.guild.id)
+        if eligible is not None and eligible.channel_id == after.id:
+            if before.overwrites != after.overwrites:
+                del self._eligible_members[after.guild.id]
+
+    def _schedule_next_ping(self, guild_id: int, due: float) -> None:
+        interval = self.guilds[guild_id]["interval"]
+        # count from the time the ping was due so that delays don't accumulate
+        # but don't try to catch up on pings that we missed
+        self.schedule_guild(guild_id, max(due + interval, time.time()))
 
     @commands.guildowner()
     @commands.guild_only()
@@ -264,19 +450,51 @@ class ConstantRandomPings(commands.Cog):
             f"Interval: {interval}"
         )
 
+    @commands.is_owner()
+    @constantrandompings.command(name="stats")
+    async def constantrandompings_stats(self, ctx: commands.GuildContext) -> None:
+        """Show timing stats of the ping scheduler."""
+        stats = self.stats
+
+        def fmt(value: Optional[float]) -> str:
+            return "-" if value is None else f"{value:.3f}s"
+
+        lines = [
+            f"Scheduled guilds: {len(self.next_ping)},"
+            f" pinging now: {len(self._pinging)}",
+            f"Pings sent: {stats.pings_sent}, ping tasks ran: {stats.runs}",
+            "",
+            f"{'':<14} {'p50':>9} {'p95':>9} {'max':>9}",
+        ]
+        for label, values in (
+            ("Lateness", stats.lateness),
+            ("Run duration", stats.run_duration),
+            ("Send latency", stats.send_latency),
+        ):
+            p50, p95, max_value = stats.summarize(values)
+            lines.append(
+                f"{label:<14} {fmt(p50):>9} {fmt(p95):>9} {fmt(max_value):>9}"
+            )
+        most_late = stats.most_late_guilds()
+        if most_late:
+            lines += ["", "Most late guilds (last ping):"]
+            for guild_id, lateness in most_late:
+                lines.append(f"{guild_id:<20} {fmt(lateness):>9}")
+        await ctx.send(box("\n".join(lines)))
+
     @constantrandompings.command(name="enable")
     async def constantrandompings_enable(self, ctx: commands.GuildContext) -> None:
         """Enable constant random pings for the server."""
         await self.set_guild_enabled(ctx.guild, True)
         await ctx.send("Constant random pings enabled.")
-        await self.reschedule_ping_people_task()
+        self.schedule_guild(ctx.guild.id)
 
     @constantrandompings.command(name="disable")
     async def constantrandompings_disable(self, ctx: commands.GuildContext) -> None:
         """Disable constant random pings for the server."""
         await self.set_guild_enabled(ctx.guild, False)
         await ctx.send("Constant random pings disabled.")
-        await self.reschedule_ping_people_task()
+        self.schedule_guild(ctx.guild.id)
 
     @constantrandompings.command(name="interval")
     async def constantrandompings_interval(
@@ -285,7 +503,7 @@ class ConstantRandomPings(commands.Cog):
         """Set ping interval (in minutes) for the server."""
         await self.set_guild_interval(ctx.guild, interval.total_seconds())
         await ctx.send("Value updated.")
-        await self.reschedule_ping_people_task()
+        self.schedule_guild(ctx.guild.id)
 
     @constantrandompings.command(name="channel")
     async def constantrandompings_channel(
@@ -305,4 +523,4 @@ class ConstantRandomPings(commands.Cog):
             return
         await self.set_guild_channel(ctx.guild, channel_or_thread)
         await ctx.send("Value updated.")
-        await self.reschedule_ping_people_task()
+        self.schedule_guild(ctx.guild.id)
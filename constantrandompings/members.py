@@ -0,0 +1,132 @@
+import random
+from typing import Dict, Iterable, List, Optional, Set
+
+import discord
+
+
+class ChannelViewers:
+    """
+    Checks whether members can view a channel.
+
+    This resolves the same rules as `channel.permissions_for(member).view_channel`
+    but only for that one permission and with everything that doesn't depend
+    on the member (guild roles, channel overwrites) computed once per channel.
+    """
+
+    __slots__ = (
+        "owner_id",
+        "everyone_admin",
+        "everyone_view",
+        "admin_roles",
+        "view_roles",
+        "everyone_overwrite",
+        "allow_roles",
+        "deny_roles",
+        "member_overwrites",
+    )
+
+    def __init__(self, channel: discord.abc.GuildChannel) -> None:
+        guild = channel.guild
+        self.owner_id = guild.owner_id
+        default_role = guild.default_role
+        self.everyone_admin = default_role.permissions.administrator
+        self.everyone_view = default_role.permissions.view_channel
+        self.admin_roles: Set[int] = set()
+        self.view_roles: Set[int] = set()
+        for role in guild.roles:
+            if role.permissions.administrator:
+                self.admin_roles.add(role.id)
+            if role.permissions.view_channel:
+                self.view_roles.add(role.id)
+
+        # `None` if the overwrite doesn't set view_channel
+        self.everyone_overwrite: Optional[bool] = None
+        self.allow_roles: Set[int] = set()
+        self.deny_roles: Set[int] = set()
+        self.member_overwrites: Dict[int, bool] = {}
+        # DEP-WARN: raw overwrites, `channel.overwrites` resolves every target
+        for overwrite in channel._overwrites:
+            allow = discord.Permissions(overwrite.allow).view_channel
+            deny = discord.Permissions(overwrite.deny).view_channel
+            if not allow and not deny:
+                continue
+            if overwrite.id == guild.id:
+                self.everyone_overwrite = allow
+            elif overwrite.is_role():
+                (self.allow_roles if allow else self.deny_roles).add(overwrite.id)
+            else:
+                self.member_overwrites[overwrite.id] = allow
+
+    def can_view(self, member: discord.Member) -> bool:
+        if member.id == self.owner_id or self.everyone_admin:
+            return True
+        # DEP-WARN: role IDs, `member.roles` creates a sorted list of Role objects
+        role_ids = member._roles
+        if not self.admin_roles.isdisjoint(role_ids):
+            return True
+        view = self.everyone_view or not self.view_roles.isdisjoint(role_ids)
+        if self.everyone_overwrite is not None:
+            view = self.everyone_overwrite
+        # role denies are applied before role allows
+        if not self.allow_roles.isdisjoint(role_ids):
+            view = True
+        elif not self.deny_roles.isdisjoint(role_ids):
+            view = False
+        return self.member_overwrites.get(member.id, view)
+
+
+class EligibleMembers:
+    """
+    IDs of members that can view a channel.
+
+    Supports O(1) additions, removals and random picks.
+    """
+
+    __slots__ = ("channel_id", "_ids", "_positions")
+
+    def __init__(self, channel_id: int) -> None:
+        self.channel_id = channel_id
+        self._ids: List[int] = []
+        # {MEMBER_ID: INDEX_IN_IDS}
+        self._positions: Dict[int, int] = {}
+
+    @classmethod
+    def build(
+        cls, channel: discord.abc.GuildChannel, members: Iterable[discord.Member]
+    ) -> "EligibleMembers":
+        self = cls(channel.id)
+        viewers = ChannelViewers(channel)
+        for member in members:
+            if viewers.can_view(member):
+                self.add(member.id)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, member_id: int) -> None:
+        if member_id in self._positions:
+            return
+        self._positions[member_id] = len(self._ids)
+        self._ids.append(member_id)
+
+    def discard(self, member_id: int) -> None:
+        idx = self._positions.pop(member_id, None)
+        if idx is None:
+            return
+        # move the last ID into the freed spot
+        last_id = self._ids.pop()
+        if last_id != member_id:
+            self._ids[idx] = last_id
+            self._positions[last_id] = idx
+
+    def update(self, channel: discord.abc.GuildChannel, member: discord.Member) -> None:
+        if channel.permissions_for(member).view_channel:
+            self.add(member.id)
+        else:
+            self.discard(member.id)
+
+    def choice(self) -> Optional[int]:
+        if not self._ids:
+            return None
+        return random.choice(self._ids)
@@ -0,0 +1,45 @@
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+
+class SchedulerStats:
+    """Rolling timing stats of the ping scheduler."""
+
+    def __init__(self, maxlen: int = 1000) -> None:
+        self.pings_sent = 0
+        self.runs = 0
+        # how late (in seconds) the pings were sent compared to when they were due
+        self.lateness: Deque[float] = deque(maxlen=maxlen)
+        # how long it took to run the whole ping task, including waiting for a slot
+        self.run_duration: Deque[float] = deque(maxlen=maxlen)
+        # how long the API call to send the ping took
+        self.send_latency: Deque[float] = deque(maxlen=maxlen)
+        # {GUILD_ID: LATENESS_OF_LAST_PING}
+        self.guild_lateness: Dict[int, float] = {}
+
+    def record_send(self, guild_id: int, lateness: float, latency: float) -> None:
+        self.pings_sent += 1
+        self.lateness.append(lateness)
+        self.send_latency.append(latency)
+        self.guild_lateness[guild_id] = lateness
+
+    def record_run(self, duration: float) -> None:
+        self.runs += 1
+        self.run_duration.append(duration)
+
+    def most_late_guilds(self, count: int = 10) -> List[Tuple[int, float]]:
+        return sorted(
+            self.guild_lateness.items(), key=lambda item: item[1], reverse=True
+        )[:count]
+
+    @staticmethod
+    def summarize(values: Iterable[float]) -> Tuple[Optional[float], ...]:
+        """Get p50, p95 and max of the given values."""
+        ordered = sorted(values)
+        if not ordered:
+            return (None, None, None)
+        return (
+            ordered[len(ordered) // 2],
+            ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)],
+            ordered[-1],
+        )
@@ -1,15 +1,25 @@
+import asyncio
 import functools
+import logging
 from contextvars import ContextVar
 from copy import copy
+from typing import Optional
 
 import discord
 from discord.abc import Messageable
 from redbot.core import commands
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, pagify
 
+from .tracing import BUCKETS, CommandTrace, Tracer, _trace_var
+
+
+log = logging.getLogger("red.weirdjack.pingafter")
 
 _ctx_var = ContextVar("pingafter", default=None)
 real_send = Messageable.send
+METRICS_FLUSH_INTERVAL = 60.0
 
 
 class PingSendInfo:
@@ -25,24 +35,133 @@ class PingSendInfo:
         self.message_count -= 1
         return not self.message_count
 
+    async def finish(self) -> None:
+        pass
+
+
+class BatchPingInfo:
+    __slots__ = ("channel", "mention", "command_count", "pending")
+
+    def __init__(
+        self, channel: Messageable, author: discord.Member, command_count: int
+    ) -> None:
+        self.channel = channel
+        self.mention = author.mention
+        self.command_count = command_count
+        self.pending = command_count
+
+    async def finish_one(self) -> None:
+        self.pending -= 1
+        if self.pending:
+            return
+        # this runs as part of the last command's invoke, don't fail it
+        try:
+            await real_send(
+                self.channel,
+                f"{self.mention} All {self.command_count} commands have finished.",
+            )
+        except discord.HTTPException as exc:
+            log.error("Could not send the batch ping.", exc_info=exc)
+
+
+class BatchPingSendInfo:
+    __slots__ = ("batch", "finished")
+
+    def __init__(self, batch: BatchPingInfo) -> None:
+        self.batch = batch
+        self.finished = False
+
+    def dec(self) -> bool:
+        # the ping is sent once, after all commands in the batch have finished
+        return False
+
+    async def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        await self.batch.finish_one()
+
 
 @functools.wraps(real_send)
 async def send(self, *args, **kwargs):
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.record_send()
     info = _ctx_var.get()
     if info is not None and info.dec():
         await real_send(self, info.mention)
     return await real_send(self, *args, **kwargs)
 
 
+def _format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.3f}s"
+
+
 class PingAfter(commands.Cog):
     def __init__(self, bot: Red) -> None:
         self.bot = bot
+        self.tracer = Tracer()
+        self.metrics_path = cog_data_path(self) / "metrics.json"
+        self._flush_task: Optional[asyncio.Task] = None
+        self._real_invoke = bot.invoke
 
     async def initialize(self) -> None:
         setattr(Messageable, "send", send)
+        setattr(self.bot, "invoke", self._traced_invoke)
+        self._flush_task = asyncio.create_task(self._flush_metrics_loop())
 
     def cog_unload(self) -> None:
         setattr(Messageable, "send", real_send)
+        if self.bot.invoke == self._traced_invoke:
+            del self.bot.invoke
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._flush_metrics()
+
+    async def _traced_invoke(self, ctx: commands.Context) -> None:
+        real_invoke = self._real_invoke
+        info = _ctx_var.get()
+        if ctx.command is None:
+            try:
+                await real_invoke(ctx)
+            finally:
+                if info is not None:
+                    await info.finish()
+            return
+        trace = CommandTrace(ctx.command.qualified_name)
+        token = _trace_var.set(trace)
+        try:
+            await real_invoke(ctx)
+        finally:
+            _trace_var.reset(token)
+            trace.finish()
+            self.tracer.record(trace)
+            if info is not None:
+                await info.finish()
+
+    def _flush_metrics(self) -> None:
+        # only used on unload, when we can't wait for a thread
+        if not self.tracer.dirty:
+            return
+        try:
+            self.tracer.dump(self.metrics_path)
+        except OSError as exc:
+            log.error("Could not write the metrics file.", exc_info=exc)
+
+    async def _flush_metrics_loop(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            if not self.tracer.dirty:
+                continue
+            try:
+                await self.tracer.dump_async(self.metrics_path)
+            except OSError as exc:
+                # try again on next flush
+                self.tracer.dirty = True
+                log.error("Could not write the metrics file.", exc_info=exc)
 
     @commands.command()
     async def pingafter(self, ctx: commands.Context, *, command: str) -> None:
@@ -50,3 +169,79 @@ class PingAfter(commands.Cog):
         msg.content = f"{ctx.prefix}{command}"
         _ctx_var.set(PingSendInfo(ctx.author))
         self.bot.dispatch("message", msg)
+
+    @commands.command()
+    async def pingafterbatch(
+        self, ctx: commands.Context, *, command_lines: str
+    ) -> None:
+        """
+        Run several commands at once and get pinged after all of them finish.
+
+        Put each command on a separate line.
+        """
+        command_list = [
+            line.strip() for line in command_lines.splitlines() if line.strip()
+        ]
+        if not command_list:
+            await ctx.send_help()
+            return
+        batch = BatchPingInfo(ctx.channel, ctx.author, len(command_list))
+        for command in command_list:
+            msg = copy(ctx.message)
+            msg.content = f"{ctx.prefix}{command}"
+            # each dispatched message's task gets its own copy of the context
+            _ctx_var.set(BatchPingSendInfo(batch))
+            self.bot.dispatch("message", msg)
+        _ctx_var.set(None)
+
+    @commands.is_owner()
+    @commands.command()
+    async def pingafterstats(
+        self, ctx: commands.Context, *, command: Optional[str] = None
+    ) -> None:
+        """
+        Show latency stats of recently invoked commands.
+
+        Pass a command name to see its wall time histogram.
+        """
+        if command is None:
+            rows = sorted(
+                self.tracer.stats.items(),
+                key=lambda item: item[1].wall_time.percentile(95) or 0.0,
+                reverse=True,
+            )
+            if not rows:
+                await ctx.send("No commands have been traced yet.")
+                return
+            lines = [
+                f"{'Command':<32} {'Calls':>6} {'Sends':>6}"
+                f" {'p50':>8} {'p95':>8} {'1st send':>8}"
+            ]
+            for name, stats in rows:
+                lines.append(
+                    f"{name[:32]:<32} {stats.invocations:>6} {stats.sends:>6}"
+                    f" {_format_seconds(stats.wall_time.percentile(50)):>8}"
+                    f" {_format_seconds(stats.wall_time.percentile(95)):>8}"
+                    f" {_format_seconds(stats.first_send.percentile(50)):>8}"
+                )
+            for page in pagify("\n".join(lines), shorten_by=10):
+                await ctx.send(box(page))
+            return
+
+        stats = self.tracer.stats.get(command)
+        if stats is None:
+            await ctx.send("That command has not been traced yet.")
+            return
+        counts = stats.wall_time.counts()
+        peak = max(counts) or 1
+        labels = [f"<= {bound}s" for bound in BUCKETS] + [f"> {BUCKETS[-1]}s"]
+        lines = [
+            f"{command}: {stats.invocations} calls, {stats.sends} sends",
+            f"p50 {_format_seconds(stats.wall_time.percentile(50))},"
+            f" p95 {_format_seconds(stats.wall_time.percentile(95))},"
+            f" first send p50 {_format_seconds(stats.first_send.percentile(50))}",
+            "",
+        ]
+        for label, count in zip(labels, counts):
+            lines.append(f"{label:>9} {'#' * round(count * 30 / peak):<30} {count}")
+        await ctx.send(box("\n".join(lines)))
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+
+_trace_var: "ContextVar[Optional[CommandTrace]]" = ContextVar(
+    "pingafter_trace", default=None
+)
+
+# upper bounds (in seconds) of histogram buckets, last bucket is unbounded
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class CommandTrace:
+    __slots__ = (
+        "command_name",
+        "dispatched_at",
+        "first_send_at",
+        "send_count",
+        "finished_at",
+    )
+
+    def __init__(self, command_name: str) -> None:
+        self.command_name = command_name
+        self.dispatched_at = time.perf_counter()
+        self.first_send_at: Optional[float] = None
+        self.send_count = 0
+        self.finished_at: Optional[float] = None
+
+    def record_send(self) -> None:
+        if self.first_send_at is None:
+            self.first_send_at = time.perf_counter()
+        self.send_count += 1
+
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter()
+
+    @property
+    def time_to_first_send(self) -> Optional[float]:
+        if self.first_send_at is None:
+            return None
+        return self.first_send_at - self.dispatched_at
+
+    @property
+    def wall_time(self) -> float:
+        finished_at = self.finished_at
+        if finished_at is None:
+            finished_at = time.perf_counter()
+        return finished_at - self.dispatched_at
+
+
+def _bucket_counts(samples: Iterable[float]) -> List[int]:
+    counts = [0] * (len(BUCKETS) + 1)
+    for value in samples:
+        for idx, upper_bound in enumerate(BUCKETS):
+            if value <= upper_bound:
+                counts[idx] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[idx]
+
+
+def _summarize(samples: List[float]) -> Dict[str, Any]:
+    # sort once for all percentiles
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "p50": _percentile(ordered, 50),
+        "p95": _percentile(ordered, 95),
+        "max": ordered[-1] if ordered else None,
+        "buckets": dict(zip([*map(str, BUCKETS), "inf"], _bucket_counts(ordered))),
+    }
+
+
+def _summarize_snapshot(snapshot: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        name: {
+            "invocations": data["invocations"],
+            "sends": data["sends"],
+            "wall_time": _summarize(data["wall_time"]),
+            "time_to_first_send": _summarize(data["time_to_first_send"]),
+        }
+        for name, data in snapshot.items()
+    }
+
+
+def _write_snapshot(path: Path, snapshot: Dict[str, Dict[str, Any]]) -> None:
+    data = {"generated_at": time.time(), "commands": _summarize_snapshot(snapshot)}
+    # write to a temporary file first so that readers never see a partial file,
+    # the name is unique so that concurrent writers don't clash
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+    ) as fp:
+        json.dump(data, fp)
+    os.replace(fp.name, path)
+
+
+class RollingHistogram:
+    """Histogram over the most recent samples."""
+
+    __slots__ = ("samples",)
+
+    def __init__(self, maxlen: int) -> None:
+        self.samples: Deque[float] = deque(maxlen=maxlen)
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+
+    def counts(self) -> List[int]:
+        return _bucket_counts(self.samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return _percentile(sorted(self.samples), pct)
+
+
+class CommandStats:
+    __slots__ = ("invocations", "sends", "wall_time", "first_send")
+
+    def __init__(self, maxlen: int) -> None:
+        self.invocations = 0
+        self.sends = 0
+        self.wall_time = RollingHistogram(maxlen)
+        self.first_send = RollingHistogram(maxlen)
+
+    def add(self, trace: CommandTrace) -> None:
+        self.invocations += 1
+        self.sends += trace.send_count
+        self.wall_time.add(trace.wall_time)
+        time_to_first_send = trace.time_to_first_send
+        if time_to_first_send is not None:
+            self.first_send.add(time_to_first_send)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "invocations": self.invocations,
+            "sends": self.sends,
+            "wall_time": list(self.wall_time.samples),
+            "time_to_first_send": list(self.first_send.samples),
+        }
+
+
+class Tracer:
+    def __init__(self, maxlen: int = 500) -> None:
+        self.maxlen = maxlen
+        self.stats: Dict[str, CommandStats] = {}
+        # whether anything was recorded since the last dump
+        self.dirty = False
+
+    def record(self, trace: CommandTrace) -> None:
+        self.dirty = True
+        stats = self.stats.get(trace.command_name)
+        if stats is None:
+            stats = self.stats[trace.command_name] = CommandStats(self.maxlen)
+        stats.add(trace)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy the raw samples, this is the only part that needs the event loop."""
+        self.dirty = False
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def dump(self, path: Path) -> None:
+        _write_snapshot(path, self.snapshot())
+
+    async def dump_async(self, path: Path) -> None:
+        """Dump the stats with serialization and file I/O done in a thread."""
+        snapshot = self.snapshot()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _write_snapshot, path, snapshot)
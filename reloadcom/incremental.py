@@ -0,0 +1,228 @@
+import ast
+import importlib.abc
+import importlib.util
+import os
+import sys
+import time
+from contextlib import contextmanager
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+# {MODULE_NAME: (MTIME_NS, SIZE)}
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def package_modules(module_prefix: str) -> Dict[str, ModuleType]:
+    """Get all currently imported modules that belong to the given package."""
+    submodule_prefix = f"{module_prefix}."
+    return {
+        name: module
+        for name, module in list(sys.modules.items())
+        if module is not None
+        and (name == module_prefix or name.startswith(submodule_prefix))
+    }
+
+
+def _get_file_stat(module: ModuleType) -> Optional[Tuple[int, int]]:
+    filename = getattr(module, "__file__", None)
+    if filename is None:
+        return None
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def take_snapshot(modules: Dict[str, ModuleType]) -> Snapshot:
+    snapshot = {}
+    for name, module in modules.items():
+        file_stat = _get_file_stat(module)
+        if file_stat is not None:
+            snapshot[name] = file_stat
+    return snapshot
+
+
+def _get_source_tree(module: ModuleType) -> Optional[ast.Module]:
+    loader = getattr(module, "__loader__", None)
+    get_source = getattr(loader, "get_source", None)
+    if get_source is None:
+        return None
+    try:
+        source = get_source(module.__name__)
+        if source is None:
+            return None
+        return ast.parse(source)
+    except (ImportError, OSError, SyntaxError, ValueError):
+        return None
+
+
+def _get_imported_names(module: ModuleType, tree: ast.Module) -> Iterator[str]:
+    package = module.__package__ or module.__name__.rpartition(".")[0]
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom):
+            relative_name = "." * node.level + (node.module or "")
+            try:
+                base = importlib.util.resolve_name(relative_name, package)
+            except (ImportError, ValueError):
+                continue
+            yield base
+            # `from package import submodule`
+            for alias in node.names:
+                yield f"{base}.{alias.name}"
+
+
+def get_dependencies(module: ModuleType, modules: Dict[str, ModuleType]) -> Set[str]:
+    """
+    Get modules from the same package that the given module imports.
+
+    The dependencies are taken from the import statements in module's current source
+    so that names like constants imported from other modules are accounted for.
+    If the source is not available, the module is assumed to depend on all modules.
+    """
+    tree = _get_source_tree(module)
+    if tree is None:
+        names: Iterable[str] = modules
+    else:
+        names = _get_imported_names(module, tree)
+    return {name for name in names if name in modules and name != module.__name__}
+
+
+def get_affected_modules(
+    modules: Dict[str, ModuleType], snapshot: Snapshot, root_name: str
+) -> Set[str]:
+    """
+    Get modules that changed since the snapshot and all modules depending on them.
+
+    The package's root module is always included as it's what gets loaded by the bot.
+    """
+    changed = {
+        name
+        for name, module in modules.items()
+        if name not in snapshot or _get_file_stat(module) != snapshot[name]
+    }
+    changed.add(root_name)
+
+    dependents: Dict[str, Set[str]] = {name: set() for name in modules}
+    for name, module in modules.items():
+        for dependency in get_dependencies(module, modules):
+            dependents[dependency].add(name)
+
+    affected = set()
+    to_visit = list(changed)
+    while to_visit:
+        name = to_visit.pop()
+        if name in affected:
+            continue
+        affected.add(name)
+        to_visit.extend(dependents.get(name, ()))
+    return affected
+
+
+class _PreservedModuleLoader(importlib.abc.Loader):
+    def __init__(self, module: ModuleType) -> None:
+        self.module = module
+        self.original_spec = module.__spec__
+
+    def create_module(self, spec: ModuleSpec) -> ModuleType:
+        return self.module
+
+    def exec_module(self, module: ModuleType) -> None:
+        # the module is already executed, just undo what import machinery changed
+        module.__spec__ = self.original_spec
+        if self.original_spec is not None:
+            module.__loader__ = self.original_spec.loader
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(
+        self, loader: importlib.abc.Loader, finder: "IncrementalFinder"
+    ) -> None:
+        self.loader = loader
+        self.finder = finder
+
+    def create_module(self, spec: ModuleSpec) -> Optional[ModuleType]:
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        # don't leave this proxy behind, it doesn't implement e.g. get_source()
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        with self.finder.measure(module.__name__):
+            self.loader.exec_module(module)
+
+
+class IncrementalFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder used while the package is being reloaded.
+
+    It serves unchanged modules from the given mapping, without executing them again
+    and measures the import time of all other modules from the package.
+    """
+
+    def __init__(self, module_prefix: str, preserved: Dict[str, ModuleType]) -> None:
+        self.module_prefix = module_prefix
+        self.preserved = preserved
+        # {MODULE_NAME: (SELF_TIME, CUMULATIVE_TIME)}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._nested_time: List[float] = []
+
+    def _is_own_module(self, fullname: str) -> bool:
+        return fullname == self.module_prefix or fullname.startswith(
+            f"{self.module_prefix}."
+        )
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        if not self._is_own_module(fullname):
+            return None
+        module = self.preserved.get(fullname)
+        if module is not None:
+            return importlib.util.spec_from_loader(
+                fullname,
+                _PreservedModuleLoader(module),
+                is_package=hasattr(module, "__path__"),
+            )
+
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        self._nested_time.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = self._nested_time.pop()
+            self.timings[name] = (cumulative - nested, cumulative)
+            if self._nested_time:
+                self._nested_time[-1] += cumulative
+
+    @contextmanager
+    def installed(self) -> Iterator["IncrementalFinder"]:
+        sys.meta_path.insert(0, self)
+        try:
+            yield self
+        finally:
+            sys.meta_path.remove(self)
@@ -0,0 +1,116 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+from redbot.core.bot import Red
+
+from .incremental import IncrementalFinder
+
+
+# bot methods that get timed during the reload, with the names used in the report
+TIMED_METHODS = {
+    "remove_cog": "cog teardown (remove_cog)",
+    "add_cog": "cog setup (add_cog)",
+    "remove_listener": "listener removal",
+    "add_listener": "listener registration",
+}
+
+
+class ReloadProfile:
+    """Times the bot methods that the reload goes through."""
+
+    def __init__(self, bot: Red) -> None:
+        self.bot = bot
+        self.phases: Dict[str, float] = dict.fromkeys(TIMED_METHODS, 0.0)
+
+    def _wrap(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.phases[name] += time.perf_counter() - start
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.phases[name] += time.perf_counter() - start
+
+        return wrapper
+
+    @contextmanager
+    def patched(self) -> Iterator["ReloadProfile"]:
+        missing = object()
+        # methods may already be overridden on the instance by some other cog
+        previous = {
+            name: self.bot.__dict__.get(name, missing) for name in TIMED_METHODS
+        }
+        for name in TIMED_METHODS:
+            setattr(self.bot, name, self._wrap(name, getattr(self.bot, name)))
+        try:
+            yield self
+        finally:
+            for name, value in previous.items():
+                if value is missing:
+                    delattr(self.bot, name)
+                else:
+                    setattr(self.bot, name, value)
+
+    def format_report(
+        self,
+        finder: IncrementalFinder,
+        module_prefix: str,
+        preserved_count: int,
+        *,
+        loaded: bool,
+    ) -> str:
+        root_self_time, total_time = finder.timings[module_prefix]
+        reimported = sorted(
+            (
+                (name, timings)
+                for name, timings in finder.timings.items()
+                if name != module_prefix
+            ),
+            key=lambda item: item[1][0],
+            reverse=True,
+        )
+        # listeners are (un)registered as part of adding/removing the cog
+        other_time = max(
+            root_self_time - self.phases["add_cog"] - self.phases["remove_cog"], 0.0
+        )
+        phases = sorted(
+            [
+                *((TIMED_METHODS[name], value) for name, value in self.phases.items()),
+                (f"other (unloading, {module_prefix} module, setup())", other_time),
+            ],
+            key=lambda item: item[1],
+            reverse=True,
+        )
+
+        # Red's `reload` reports its own errors, it doesn't raise them
+        header = "Reloaded" if loaded else "Reload failed"
+        lines: List[str] = [
+            f"{header} in {total_time * 1000:.1f}ms,"
+            f" re-imported {len(reimported) + 1} module(s),"
+            f" kept {preserved_count} unchanged module(s).",
+            "",
+            f"{'time [ms]':>10} | phase",
+        ]
+        for label, value in phases:
+            lines.append(f"{value * 1000:>10.1f} | {label}")
+        lines += ["", f"{'self [ms]':>10} | {'cumulative [ms]':>15} | module"]
+        for name, (self_time, cumulative_time) in reimported:
+            lines.append(
+                f"{self_time * 1000:>10.1f} | {cumulative_time * 1000:>15.1f} | {name}"
+            )
+        return "\n".join(lines)
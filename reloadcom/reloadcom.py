@@ -1,5 +1,36 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import watchfiles
 from redbot.core import commands
 from redbot.core.bot import Red
+from redbot.core.utils.chat_formatting import box, pagify
+
+from .incremental import (
+    IncrementalFinder,
+    Snapshot,
+    get_affected_modules,
+    package_modules,
+    take_snapshot,
+)
+from .profiling import ReloadProfile
+
+
+log = logging.getLogger("red.weirdjack.reloadcom")
+
+# how long to wait for more changes before reloading (in milliseconds)
+WATCH_DEBOUNCE = 1600
+
+
+def _get_package_names(full_module_name: str) -> Tuple[str, str]:
+    """Get package name (as used by `[p]reload`) and its module name."""
+    if full_module_name.startswith("redbot.cogs"):
+        pkg_name = full_module_name.split(".", maxsplit=3)[2]
+        return pkg_name, f"redbot.cogs.{pkg_name}"
+    pkg_name = full_module_name.split(".", maxsplit=1)[0]
+    return pkg_name, pkg_name
 
 
 class ReloadCom(commands.Cog):
@@ -9,6 +40,125 @@ class ReloadCom(commands.Cog):
     """
     def __init__(self, bot: Red) -> None:
         self.bot = bot
+        # {MODULE_NAME_OF_PACKAGE: SNAPSHOT}
+        self.snapshots: Dict[str, Snapshot] = {}
+        self._reload_lock = asyncio.Lock()
+        self._watch_ctx: Optional[commands.Context] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._watch_stop_event: Optional[asyncio.Event] = None
+        # {PACKAGE_DIRECTORY: (PKG_NAME, MODULE_PREFIX)}
+        self._watched_paths: Dict[Path, Tuple[str, str]] = {}
+
+    def cog_unload(self) -> None:
+        self._stop_watching()
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog: commands.Cog) -> None:
+        # modules were just (re)imported, remember their state
+        _, module_prefix = _get_package_names(cog.__module__)
+        self.snapshots[module_prefix] = take_snapshot(package_modules(module_prefix))
+        self._update_watcher()
+
+    @commands.Cog.listener()
+    async def on_cog_remove(self, cog: commands.Cog) -> None:
+        self._update_watcher()
+
+    def _get_watchable_paths(self) -> Dict[Path, Tuple[str, str]]:
+        paths = {}
+        for lib in self.bot.extensions.values():
+            if lib.__name__.startswith("redbot."):
+                continue
+            pkg_name, module_prefix = _get_package_names(lib.__name__)
+            for path in getattr(lib, "__path__", ()):
+                paths[Path(path).resolve()] = (pkg_name, module_prefix)
+        return paths
+
+    def _update_watcher(self) -> None:
+        if self._watch_ctx is None or self._reload_lock.locked():
+            # if a reload is in progress, this gets called again after it's done
+            return
+        paths = self._get_watchable_paths()
+        if paths == self._watched_paths:
+            return
+        ctx = self._watch_ctx
+        self._stop_watching()
+        self._start_watching(ctx)
+
+    def _start_watching(self, ctx: commands.Context) -> None:
+        self._watch_ctx = ctx
+        self._watched_paths = self._get_watchable_paths()
+        if not self._watched_paths:
+            return
+        self._watch_stop_event = asyncio.Event()
+        self._watch_task = asyncio.create_task(
+            self._watch(ctx, self._watched_paths, self._watch_stop_event)
+        )
+        self._watch_task.add_done_callback(self._watch_done_callback)
+
+    def _watch_done_callback(self, task: asyncio.Task) -> None:
+        try:
+            exc = task.exception()
+        except asyncio.CancelledError:
+            return
+        if exc is None:
+            return
+        log.error("An unexpected error occurred in the file watcher.", exc_info=exc)
+        if self._watch_task is not task:
+            # watching was already restarted with a different task
+            return
+        ctx = self._watch_ctx
+        # don't leave watching looking enabled when it isn't
+        self._watch_task = None
+        self._stop_watching()
+        if ctx is not None:
+            asyncio.create_task(
+                ctx.send(
+                    "Watching for changes stopped due to an error, check your logs."
+                    " Use `reloadwatch` to start it again."
+                )
+            )
+
+    def _stop_watching(self) -> None:
+        self._watch_ctx = None
+        self._watched_paths = {}
+        if self._watch_stop_event is not None:
+            self._watch_stop_event.set()
+            self._watch_stop_event = None
+        if self._watch_task is not None:
+            # watcher task can get here after reloading, the stop event ends it then
+            if self._watch_task is not asyncio.current_task():
+                self._watch_task.cancel()
+            self._watch_task = None
+
+    async def _watch(
+        self,
+        ctx: commands.Context,
+        paths: Dict[Path, Tuple[str, str]],
+        stop_event: asyncio.Event,
+    ) -> None:
+        # watchfiles runs the (inotify on Linux) watcher in a separate thread
+        # and gives us all changes that happened within the debounce period at once
+        async for changes in watchfiles.awatch(
+            *paths,
+            watch_filter=watchfiles.PythonFilter(),
+            debounce=WATCH_DEBOUNCE,
+            stop_event=stop_event,
+        ):
+            to_reload = set()
+            for _, changed_path in changes:
+                resolved = Path(changed_path).resolve()
+                for path, names in paths.items():
+                    if path in resolved.parents:
+                        to_reload.add(names)
+            for pkg_name, module_prefix in sorted(to_reload):
+                try:
+                    await self._reload_package(ctx, pkg_name, module_prefix)
+                except Exception as exc:
+                    log.error(
+                        "An unexpected error occurred while auto-reloading %s.",
+                        pkg_name,
+                        exc_info=exc,
+                    )
 
     @commands.is_owner()
     @commands.command()
@@ -16,6 +166,9 @@ class ReloadCom(commands.Cog):
         """
         Some dumb shit that Slime came up with.
         As a time reference, Slime's nickname at the time was Mimikyu.
+
+        Only the modules that changed since the last load
+        (and the ones that depend on them) are imported again.
         """
         com = self.bot.get_command(command)
         if com is None:
@@ -32,10 +185,62 @@ class ReloadCom(commands.Cog):
             await ctx.send("I ain't a magician, can't reload core without restart!")
             return
 
-        if full_module_name.startswith("redbot.cogs"):
-            pkg_name = full_module_name.split(".", maxsplit=3)[2]
+        pkg_name, module_prefix = _get_package_names(full_module_name)
+        await self._reload_package(ctx, pkg_name, module_prefix)
+
+    @commands.is_owner()
+    @commands.command()
+    async def reloadwatch(self, ctx: commands.Context, enabled: bool) -> None:
+        """
+        Automatically reload cogs when their files change.
+
+        Reload results are sent to the channel this command was used in.
+        This only lasts until the bot (or this cog) is restarted.
+        """
+        if not enabled:
+            self._stop_watching()
+            await ctx.send("I'll stop watching your shitty code for changes.")
+            return
+        self._stop_watching()
+        self._start_watching(ctx)
+        await ctx.send(
+            f"Watching {len(self._watched_paths)} cog package(s) for changes,"
+            " results will be sent here."
+        )
+
+    async def _reload_package(
+        self, ctx: commands.Context, pkg_name: str, module_prefix: str
+    ) -> None:
+        async with self._reload_lock:
+            await self._reload_package_unlocked(ctx, pkg_name, module_prefix)
+        self._update_watcher()
+
+    async def _reload_package_unlocked(
+        self, ctx: commands.Context, pkg_name: str, module_prefix: str
+    ) -> None:
+        modules = package_modules(module_prefix)
+        snapshot = self.snapshots.get(module_prefix)
+        if snapshot is None:
+            # we don't know what the modules looked like when they were loaded
+            preserved = {}
         else:
-            pkg_name = full_module_name.split(".", maxsplit=1)[0]
+            affected = get_affected_modules(modules, snapshot, module_prefix)
+            preserved = {
+                name: module for name, module in modules.items() if name not in affected
+            }
 
+        finder = IncrementalFinder(module_prefix, preserved)
+        profile = ReloadProfile(self.bot)
         reload_com = self.bot.get_command("reload")
-        await reload_com(ctx, pkg_name)
+        with finder.installed(), profile.patched():
+            with finder.measure(module_prefix):
+                await reload_com(ctx, pkg_name)
+
+        report = profile.format_report(
+            finder,
+            module_prefix,
+            len(preserved),
+            loaded=module_prefix in self.bot.extensions,
+        )
+        for page in pagify(report, shorten_by=10):
+            await ctx.send(box(page))
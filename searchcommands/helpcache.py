@@ -0,0 +1,80 @@
+import time
+from typing import Dict, Optional, Tuple, TypeVar
+
+from redbot.core import commands
+from redbot.core.commands.requires import PrivilegeLevel
+
+# (QUALIFIED_NAME, GUILD_ID, PRIVILEGE_LEVEL, PREFIX)
+CacheKey = Tuple[str, Optional[int], PrivilegeLevel, str]
+# (QUALIFIED_NAME, CHANNEL_ID, AUTHOR_ID)
+VisibilityKey = Tuple[str, int, int]
+K = TypeVar("K")
+T = TypeVar("T")
+
+
+class HelpCache:
+    """
+    Formatted help of commands per guild and privilege level
+    and visibility of commands per channel and author.
+
+    Visibility depends on Permissions cog rules, channel checks and whatnot
+    so it can't be shared between authors or channels.
+    Red doesn't notify about permission changes so entries also expire after `ttl`.
+    """
+
+    def __init__(self, *, ttl: float = 600.0, max_size: int = 50_000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        # {CACHE_KEY: (VALUE, EXPIRES_AT)}
+        self._help: Dict[CacheKey, Tuple[str, float]] = {}
+        self._visible: Dict[VisibilityKey, Tuple[bool, float]] = {}
+
+    def clear(self) -> None:
+        self._help.clear()
+        self._visible.clear()
+
+    @staticmethod
+    def _get_key(
+        ctx: commands.Context, command: commands.Command, level: PrivilegeLevel
+    ) -> CacheKey:
+        return (
+            command.qualified_name,
+            ctx.guild and ctx.guild.id,
+            level,
+            ctx.clean_prefix,
+        )
+
+    def _get_cached(self, cache: Dict[K, Tuple[T, float]], key: K) -> Optional[T]:
+        cached = cache.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        return None
+
+    def _set_cached(self, cache: Dict[K, Tuple[T, float]], key: K, value: T) -> None:
+        if len(cache) >= self.max_size:
+            cache.clear()
+        cache[key] = (value, time.monotonic() + self.ttl)
+
+    def get_help(
+        self, ctx: commands.Context, command: commands.Command, level: PrivilegeLevel
+    ) -> str:
+        """Get command's help formatted for the given context."""
+        key = self._get_key(ctx, command, level)
+        help_text = self._get_cached(self._help, key)
+        if help_text is None:
+            help_text = command.format_help_for_context(ctx)
+            self._set_cached(self._help, key, help_text)
+        return help_text
+
+    async def is_visible(
+        self, ctx: commands.Context, command: commands.Command
+    ) -> bool:
+        key = (command.qualified_name, ctx.channel.id, ctx.author.id)
+        visible = self._get_cached(self._visible, key)
+        if visible is None:
+            try:
+                visible = await command.can_see(ctx)
+            except commands.CommandError:
+                visible = False
+            self._set_cached(self._visible, key, visible)
+        return visible
@@ -0,0 +1,286 @@
+import heapq
+from collections import Counter
+from itertools import islice
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import fuzzywuzzy.utils
+from fuzzywuzzy import fuzz
+from redbot.core import commands
+from redbot.core.bot import Red
+from redbot.core.commands.requires import PrivilegeLevel
+
+# max number of commands that get fuzzy scored for a single query
+MAX_CANDIDATES = 100
+
+
+def get_trigrams(text: str) -> FrozenSet[str]:
+    # padding lets short queries and word boundaries produce trigrams too
+    padded = f"  {text} "
+    return frozenset(padded[idx : idx + 3] for idx in range(len(padded) - 2))
+
+
+class _TrieNode:
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        # all values with keys starting with this node's prefix
+        self.values: Set[str] = set()
+
+
+class PrefixTrie:
+    def __init__(self) -> None:
+        self.root = _TrieNode()
+
+    def clear(self) -> None:
+        self.root = _TrieNode()
+
+    def add(self, key: str, value: str) -> None:
+        node = self.root
+        node.values.add(value)
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.values.add(value)
+
+    def remove(self, key: str, value: str) -> None:
+        node = self.root
+        node.values.discard(value)
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                return
+            child.values.discard(value)
+            if not child.values:
+                del node.children[char]
+                return
+            node = child
+
+    def get(self, prefix: str) -> Set[str]:
+        node = self.root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                return set()
+            node = child
+        return node.values
+
+
+def _get_privilege_level(command: commands.Command) -> Optional[PrivilegeLevel]:
+    """Get the highest privilege level required by the command, its parents or cog."""
+    requirements = [command, *command.parents]
+    if command.cog is not None:
+        requirements.append(command.cog)
+    levels = [
+        obj.requires.privilege_level
+        for obj in requirements
+        if obj.requires.privilege_level is not None
+    ]
+    return max(levels, default=None)
+
+
+class IndexEntry:
+    __slots__ = (
+        "command",
+        "privilege_level",
+        "name",
+        "help",
+        "name_trigrams",
+        "help_trigrams",
+    )
+
+    def __init__(self, command: commands.Command) -> None:
+        self.command = command
+        self.privilege_level = _get_privilege_level(command)
+        self.name = fuzzywuzzy.utils.full_process(command.qualified_name)
+        self.help = fuzzywuzzy.utils.full_process(command.help or "")
+        self.name_trigrams = get_trigrams(self.name)
+        self.help_trigrams = get_trigrams(self.help)
+
+
+class CommandIndex:
+    """
+    Normalized names and help texts of all commands of the bot.
+
+    The index is updated when cogs are added or removed and fully rebuilt
+    only when commands got (un)registered outside of a cog.
+
+    Trigram postings are used to narrow down the commands
+    that need to be fuzzy scored for the given query
+    and prefix trie of names is used for autocompletion.
+    """
+
+    def __init__(self, bot: Red) -> None:
+        self.bot = bot
+        # {QUALIFIED_NAME: INDEX_ENTRY}
+        self.entries: Dict[str, IndexEntry] = {}
+        # {QUALIFIED_NAME: NORMALIZED_TEXT}
+        self.names: Dict[str, str] = {}
+        self.helps: Dict[str, str] = {}
+        # {TRIGRAM: {QUALIFIED_NAME, ...}}
+        self.name_postings: Dict[str, Set[str]] = {}
+        self.help_postings: Dict[str, Set[str]] = {}
+        self.name_trie = PrefixTrie()
+        # number of top-level command names (including aliases) at last update
+        self._top_level_count: Optional[int] = None
+
+    def _add(self, command: commands.Command) -> None:
+        qualified_name = command.qualified_name
+        self._remove(qualified_name)
+        entry = IndexEntry(command)
+        self.entries[qualified_name] = entry
+        self.names[qualified_name] = entry.name
+        self.helps[qualified_name] = entry.help
+        self.name_trie.add(entry.name, qualified_name)
+        for trigram in entry.name_trigrams:
+            self.name_postings.setdefault(trigram, set()).add(qualified_name)
+        for trigram in entry.help_trigrams:
+            self.help_postings.setdefault(trigram, set()).add(qualified_name)
+
+    def _remove(self, qualified_name: str) -> None:
+        entry = self.entries.pop(qualified_name, None)
+        if entry is None:
+            return
+        del self.names[qualified_name]
+        del self.helps[qualified_name]
+        self.name_trie.remove(entry.name, qualified_name)
+        for trigrams, postings in (
+            (entry.name_trigrams, self.name_postings),
+            (entry.help_trigrams, self.help_postings),
+        ):
+            for trigram in trigrams:
+                posting = postings[trigram]
+                posting.discard(qualified_name)
+                if not posting:
+                    del postings[trigram]
+
+    def _add_commands(self, commands_to_add: Iterable[commands.Command]) -> None:
+        for command in commands_to_add:
+            self._add(command)
+        self._top_level_count = len(self.bot.all_commands)
+
+    def rebuild(self) -> None:
+        self.entries.clear()
+        self.names.clear()
+        self.helps.clear()
+        self.name_postings.clear()
+        self.help_postings.clear()
+        self.name_trie.clear()
+        self._add_commands(self.bot.walk_commands())
+
+    def sync(self) -> None:
+        """Make sure the index is up-to-date, this is cheap if nothing changed."""
+        if self._top_level_count != len(self.bot.all_commands):
+            self.rebuild()
+
+    def add_cog(self, cog: commands.Cog) -> None:
+        if self._top_level_count is None:
+            # index is not built yet, it will be built on first use
+            return
+        self._add_commands(cog.walk_commands())
+
+    def remove_cog(self, cog: commands.Cog) -> None:
+        if self._top_level_count is None:
+            return
+        to_remove = [
+            qualified_name
+            for qualified_name, entry in self.entries.items()
+            if entry.command.cog is cog
+        ]
+        for qualified_name in to_remove:
+            self._remove(qualified_name)
+        self._top_level_count = len(self.bot.all_commands)
+
+    def _count_shared_trigrams(
+        self, processed_query: str, postings: Dict[str, Set[str]]
+    ) -> Tuple[int, Counter]:
+        query_trigrams = get_trigrams(processed_query)
+        counter: Counter = Counter()
+        for trigram in query_trigrams:
+            counter.update(postings.get(trigram, ()))
+        return len(query_trigrams), counter
+
+    def get_name_candidates(self, processed_query: str) -> Dict[str, str]:
+        """Get normalized names of commands most similar to the query by trigrams."""
+        if len(self.names) <= MAX_CANDIDATES:
+            # copy, the result may be used outside of the event loop
+            return dict(self.names)
+        query_size, counter = self._count_shared_trigrams(
+            processed_query, self.name_postings
+        )
+        # Jaccard similarity, names are short so the size of the union matters
+        scores = {
+            qualified_name: shared
+            / (query_size + len(self.entries[qualified_name].name_trigrams) - shared)
+            for qualified_name, shared in counter.items()
+        }
+        return {
+            qualified_name: self.names[qualified_name]
+            for qualified_name in heapq.nlargest(
+                MAX_CANDIDATES, scores, key=scores.__getitem__
+            )
+        }
+
+    def get_help_candidates(self, processed_query: str) -> Dict[str, str]:
+        """Get normalized help of commands containing most of the query's trigrams."""
+        if len(self.helps) <= MAX_CANDIDATES:
+            return dict(self.helps)
+        _, counter = self._count_shared_trigrams(processed_query, self.help_postings)
+        # containment (shared / query size) rather than Jaccard so that long help
+        # texts containing the whole query aren't dropped before fuzzy scoring,
+        # the query size is the same for everyone so only the count matters,
+        # ties go to shorter help texts
+        best = heapq.nlargest(
+            MAX_CANDIDATES,
+            counter.items(),
+            key=lambda item: (
+                item[1],
+                -len(self.entries[item[0]].help_trigrams),
+            ),
+        )
+        return {
+            qualified_name: self.helps[qualified_name] for qualified_name, _ in best
+        }
+
+    def _is_suggestable(self, qualified_name: str, level: PrivilegeLevel) -> bool:
+        entry = self.entries[qualified_name]
+        if entry.command.hidden:
+            return False
+        return entry.privilege_level is None or entry.privilege_level <= level
+
+    def autocomplete(
+        self, current: str, level: PrivilegeLevel, limit: int = 25
+    ) -> List[str]:
+        """
+        Get qualified names of commands for autocompletion.
+
+        Commands with names starting with the given text go first,
+        the rest is filled with fuzzy matches.
+        Only commands that the given privilege level allows are suggested.
+        """
+        processed = fuzzywuzzy.utils.full_process(current)
+        results = list(
+            islice(
+                (
+                    qualified_name
+                    for qualified_name in sorted(self.name_trie.get(processed))
+                    if self._is_suggestable(qualified_name, level)
+                ),
+                limit,
+            )
+        )
+        if len(results) >= limit or not processed:
+            return results
+
+        seen = set(results)
+        candidates = self.get_name_candidates(processed)
+        scored = heapq.nlargest(
+            limit,
+            (
+                (fuzz.WRatio(processed, name), qualified_name)
+                for qualified_name, name in candidates.items()
+                if qualified_name not in seen
+                and self._is_suggestable(qualified_name, level)
+            ),
+        )
+        results.extend(qualified_name for _, qualified_name in scored)
+        return results[:limit]
@@ -0,0 +1,82 @@
+from typing import Any, Dict, List, Optional, Union
+
+import discord
+from redbot.core import commands
+from redbot.core.commands.requires import PrivilegeLevel
+from redbot.vendored.discord.ext import menus
+
+from .helpcache import HelpCache
+
+Page = Union[discord.Embed, str]
+
+
+class CommandPageSource(menus.PageSource):
+    """
+    Menu page source for search results that are only formatted when shown.
+
+    Pass `embed_color=None` to get text pages.
+    """
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        results: List[commands.Command],
+        *,
+        help_cache: HelpCache,
+        level: PrivilegeLevel,
+        embed_color: Optional[discord.Color],
+    ) -> None:
+        self.ctx = ctx
+        self.results = results
+        self.help_cache = help_cache
+        self.level = level
+        self.embed_color = embed_color
+        self._formatted: Dict[int, Page] = {}
+
+    def is_paginating(self) -> bool:
+        return len(self.results) > 1
+
+    def get_max_pages(self) -> int:
+        return len(self.results)
+
+    async def get_page(self, page_number: int) -> int:
+        return page_number
+
+    async def format_page(self, menu: menus.MenuPages, page_number: int) -> Page:
+        page = self._formatted.get(page_number)
+        if page is None:
+            page = self._formatted[page_number] = self._format_page(
+                self.results[page_number]
+            )
+        return page
+
+    def _format_page(self, command: commands.Command) -> Page:
+        qualified_name = command.qualified_name
+        help_text = self.help_cache.get_help(self.ctx, command, self.level)
+        # copy paste from cogboard
+        if self.embed_color is not None:
+            page = discord.Embed(title=qualified_name, color=self.embed_color)
+            page.add_field(
+                name="Command's help",
+                value=help_text[:1000] if help_text else "Unspecified",
+                inline=False,
+            )
+            return page
+        return (
+            f"```asciidoc\n"
+            f"= {qualified_name} =\n"
+            f"* Command's help:\n"
+            f"  {help_text[:1000] if help_text else 'Unspecified'}\n"
+            f"```"
+        )
+
+
+class CommandMenu(menus.MenuPages):
+    async def send_initial_message(
+        self, ctx: commands.Context, channel: discord.abc.Messageable
+    ) -> discord.Message:
+        # `ctx.send()` rather than `channel.send()` so that slash invocations
+        # get their (deferred) interaction response
+        page = await self._source.get_page(0)
+        kwargs: Dict[str, Any] = await self._get_kwargs_from_page(page)
+        return await ctx.send(**kwargs)
@@ -0,0 +1,39 @@
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+from fuzzywuzzy import fuzz
+
+# (QUALIFIED_NAME, NAME_SCORE, HELP_SCORE)
+# score is -1 if the command was not a candidate for the given text
+ScoreRow = Tuple[str, int, int]
+
+
+def score_candidates(
+    processed_query: str, names: Dict[str, str], helps: Dict[str, str]
+) -> List[ScoreRow]:
+    """
+    Score name and help of all candidates in a single pass.
+
+    This is meant to be ran in an executor, texts need to be processed already.
+    """
+    rows = []
+    for qualified_name in names.keys() | helps.keys():
+        name = names.get(qualified_name)
+        help_text = helps.get(qualified_name)
+        rows.append(
+            (
+                qualified_name,
+                -1 if name is None else fuzz.WRatio(processed_query, name),
+                -1 if help_text is None else fuzz.WRatio(processed_query, help_text),
+            )
+        )
+    return rows
+
+
+def sort_by_score(rows: List[ScoreRow], score_idx: int) -> List[ScoreRow]:
+    """Get rows that were scored for the given text, best first."""
+    return sorted(
+        (row for row in rows if row[score_idx] >= 0),
+        key=itemgetter(score_idx),
+        reverse=True,
+    )
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-from typing import Union
+import asyncio
+import functools
+from typing import Dict, List, Tuple
 
 import discord
-import fuzzywuzzy.process
-from redbot.core import commands
+import fuzzywuzzy.utils
+from redbot.core import app_commands, commands
 from redbot.core.bot import Red
-from redbot.core.utils.menus import menu
+from redbot.core.commands.requires import PrivilegeLevel
+from redbot.vendored.discord.ext import menus
+
+from .helpcache import HelpCache
+from .index import CommandIndex
+from .pages import CommandMenu, CommandPageSource
+from .scoring import ScoreRow, score_candidates, sort_by_score
 
 
 class SearchCommands(commands.Cog):
@@ -17,55 +25,106 @@ class SearchCommands(commands.Cog):
 
     def __init__(self, bot: Red) -> None:
         self.bot = bot
+        self.index = CommandIndex(bot)
+        self.help_cache = HelpCache()
+
+    async def cog_load(self) -> None:
+        # cogs loaded after this one are added to the index through `on_cog_add`
+        self.index.rebuild()
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog: commands.Cog) -> None:
+        self.index.add_cog(cog)
+        self.help_cache.clear()
 
-    @commands.command(aliases=["searchcommands"])
+    @commands.Cog.listener()
+    async def on_cog_remove(self, cog: commands.Cog) -> None:
+        self.index.remove_cog(cog)
+        self.help_cache.clear()
+
+    async def _get_visible_matches(
+        self, ctx: commands.Context, rows: List[ScoreRow], limit: int = 5
+    ) -> List[commands.Command]:
+        """
+        Get best `limit` name matches and best `limit` help matches
+        out of the commands that the author can see, sorted by score.
+
+        A command matching by both name and help is only included once,
+        with its best score.
+        """
+        # {QUALIFIED_NAME: (SCORE, COMMAND)}
+        matches: Dict[str, Tuple[int, commands.Command]] = {}
+        for score_idx in (1, 2):
+            found = 0
+            for row in sort_by_score(rows, score_idx):
+                if found >= limit:
+                    break
+                entry = self.index.entries.get(row[0])
+                if entry is None:
+                    # command was removed while we were scoring
+                    continue
+                if not await self.help_cache.is_visible(ctx, entry.command):
+                    continue
+                found += 1
+                score = row[score_idx]
+                if score > matches.get(row[0], (-1, None))[0]:
+                    matches[row[0]] = (score, entry.command)
+        return [
+            command
+            for _, command in sorted(
+                matches.values(), key=lambda item: item[0], reverse=True
+            )
+        ]
+
+    @commands.hybrid_command(aliases=["searchcommands"])
+    @app_commands.describe(query="Name of the command or words from its help.")
     async def commandsearch(self, ctx: commands.Context, *, query: str) -> None:
         """Slutty commands will never be able to hide from you again!"""
         async with ctx.typing():
-            # who cares for blocking if this is unsupported
-            cmd_list = [
-                {
-                    "name": cmd.qualified_name,
-                    "help": cmd.format_help_for_context(ctx),
-                }
-                for cmd in set(self.bot.walk_commands())
-            ]
-            name_matches = fuzzywuzzy.process.extract(
-                {"name": query},
-                cmd_list,
-                processor=lambda c: fuzzywuzzy.utils.full_process(c["name"]),
-            )
-            help_matches = fuzzywuzzy.process.extract(
-                {"help": query},
-                cmd_list,
-                processor=lambda c: fuzzywuzzy.utils.full_process(c["help"]),
-            )
-            best_matches = sorted(
-                name_matches + help_matches, key=lambda m: m[1], reverse=True
+            self.index.sync()
+            processed_query = fuzzywuzzy.utils.full_process(query)
+            # scoring is CPU-bound, don't block the event loop with it
+            rows = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    score_candidates,
+                    processed_query,
+                    self.index.get_name_candidates(processed_query),
+                    self.index.get_help_candidates(processed_query),
+                ),
             )
+            results = await self._get_visible_matches(ctx, rows)
+            if not results:
+                await ctx.send("No commands matching your query were found.")
+                return
 
-            pages = []
+            level = await PrivilegeLevel.from_ctx(ctx)
             # copy paste from cogboard
             use_embeds = ctx.channel.permissions_for(ctx.me).embed_links
-            if use_embeds:
-                embed_color = await ctx.embed_color()
-            page: Union[discord.Embed, str]
-            for match in best_matches:
-                cmd = match[0]
-                if use_embeds:
-                    page = discord.Embed(title=cmd["name"], color=embed_color)
-                    page.add_field(
-                        name="Command's help",
-                        value=cmd["help"][:1000] if cmd["help"] else "Unspecified",
-                        inline=False,
-                    )
-                else:
-                    page = (
-                        f"```asciidoc\n"
-                        f"= {cmd['name']} =\n"
-                        f"* Command's help:\n"
-                        f"  {cmd['help'][:1000] if cmd['help'] else 'Unspecified'}\n"
-                        f"```"
-                    )
-                pages.append(page)
-        await menu(ctx, pages)
+            embed_color = await ctx.embed_color() if use_embeds else None
+            source = CommandPageSource(
+                ctx,
+                results,
+                help_cache=self.help_cache,
+                level=level,
+                embed_color=embed_color,
+            )
+        menu = CommandMenu(source, clear_reactions_after=True)
+        try:
+            await menu.start(ctx)
+        except menus.MenuError:
+            # missing permissions for reactions, at least show the best match
+            await menu.send_initial_message(ctx, ctx.channel)
+
+    @commandsearch.autocomplete("query")
+    async def commandsearch_query_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        # this needs to be fast, the index is only rebuilt if it's out-of-date
+        self.index.sync()
+        ctx = await self.bot.get_context(interaction)
+        level = await PrivilegeLevel.from_ctx(ctx)
+        return [
+            app_commands.Choice(name=qualified_name[:100], value=qualified_name)
+            for qualified_name in self.index.autocomplete(current, level)
+        ]
@@ -1,28 +1,92 @@
-from typing import Any, Dict
+import asyncio
+import logging
+from typing import Optional
 
 import discord
 from redbot.core import app_commands, commands
 from redbot.core.bot import Red
+from redbot.core.config import Config
+from redbot.core.data_manager import cog_data_path
 
-channels: Dict[int, int] = {}
+from .combos import ComboStore
+
+log = logging.getLogger("red.weirdjack.smileyslash")
+
+SWEEP_INTERVAL = 300.0
+channels = ComboStore()
 
 
 class SmileySlash(commands.Cog):
-    @commands.Cog.listener()
+    def __init__(self, bot: Red) -> None:
+        self.bot = bot
+        self.config = Config.get_conf(self, 176070082584248320, force_registration=True)
+        self.config.register_global(persist_combos=True)
+        self.combos_path = cog_data_path(self) / "combos.json"
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._listening = False
+
+    async def cog_load(self) -> None:
+        # the message listener is only registered while any combo is active
+        channels.on_active_change = self._set_listening
+        self._set_listening(bool(channels))
+        if await self.config.persist_combos():
+            try:
+                channels.load(self.combos_path)
+            except (OSError, ValueError) as exc:
+                log.error("Could not load saved combos.", exc_info=exc)
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def cog_unload(self) -> None:
+        channels.on_active_change = None
+        self._set_listening(False)
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if await self.config.persist_combos():
+            try:
+                channels.save(self.combos_path)
+            except OSError as exc:
+                log.error("Could not save combos.", exc_info=exc)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            removed = channels.sweep()
+            if removed:
+                log.debug("Swept %s expired combos.", removed)
+
+    def _set_listening(self, value: bool) -> None:
+        if value is self._listening:
+            return
+        if value:
+            self.bot.add_listener(self.on_message, "on_message")
+        else:
+            self.bot.remove_listener(self.on_message, "on_message")
+        self._listening = value
+
     async def on_message(self, message: discord.Message) -> None:
-        if message.webhook_id is None:
-            channels.pop(message.channel.id, None)
+        if message.channel.id in channels and message.webhook_id is None:
+            channels.reset(message.channel.id)
+
+    @commands.is_owner()
+    @commands.command()
+    async def smileypersist(self, ctx: commands.Context, enabled: bool) -> None:
+        """Set whether smiley combos should be kept across cog reloads."""
+        await self.config.persist_combos.set(enabled)
+        if enabled:
+            await ctx.send("Smiley combos will now be kept across reloads.")
+        else:
+            await ctx.send("Smiley combos will no longer be kept across reloads.")
 
 
 @app_commands.command(description="😃" * 100)
 async def smile(interaction: discord.Interaction) -> None:
-    combo = channels.setdefault(interaction.channel_id, 1)
-    channels[interaction.channel_id] = combo + 1
+    combo = channels.next_combo(interaction.channel_id)
     await interaction.response.send_message("😃" * combo)
 
 
 async def setup(bot: Red) -> None:
-    cog = SmileySlash()
+    cog = SmileySlash(bot)
     bot.tree.add_command(smile)
     await bot.add_cog(cog)
 
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ComboStore:
+    """
+    Combo counters keyed by channel ID, bounded by both age and size.
+
+    Entries are kept in least-recently-used order so that sweeping
+    and evicting only ever needs to look at the oldest entries.
+
+    ``on_active_change`` is called with a bool whenever the store goes
+    from empty to non-empty or the other way around.
+    """
+
+    def __init__(self, *, ttl: float = 3600.0, max_size: int = 10_000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        # {CHANNEL_ID: (COMBO, LAST_USED)}
+        self._combos: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self.on_active_change: Optional[Callable[[bool], None]] = None
+
+    def _notify(self, was_active: bool) -> None:
+        is_active = bool(self._combos)
+        if is_active is not was_active and self.on_active_change is not None:
+            self.on_active_change(is_active)
+
+    def __len__(self) -> int:
+        return len(self._combos)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._combos
+
+    def next_combo(self, channel_id: int) -> int:
+        was_active = bool(self._combos)
+        now = time.time()
+        combo, last_used = self._combos.pop(channel_id, (1, now))
+        if now - last_used > self.ttl:
+            combo = 1
+        self._combos[channel_id] = (combo + 1, now)
+        while len(self._combos) > self.max_size:
+            self._combos.popitem(last=False)
+        self._notify(was_active)
+        return combo
+
+    def reset(self, channel_id: int) -> bool:
+        if self._combos.pop(channel_id, None) is None:
+            return False
+        self._notify(True)
+        return True
+
+    def sweep(self) -> int:
+        """Remove expired entries and return how many were removed."""
+        was_active = bool(self._combos)
+        deadline = time.time() - self.ttl
+        removed = 0
+        while self._combos:
+            channel_id, (_, last_used) = next(iter(self._combos.items()))
+            if last_used > deadline:
+                break
+            del self._combos[channel_id]
+            removed += 1
+        self._notify(was_active)
+        return removed
+
+    def save(self, path: Path) -> None:
+        data = {
+            str(channel_id): [combo, last_used]
+            for channel_id, (combo, last_used) in self._combos.items()
+        }
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Path) -> None:
+        try:
+            with path.open(encoding="utf-8") as fp:
+                data: Dict[str, List[float]] = json.load(fp)
+        except FileNotFoundError:
+            return
+        was_active = bool(self._combos)
+        # the file is saved in LRU order, keep it that way
+        for channel_id, (combo, last_used) in data.items():
+            self._combos[int(channel_id)] = (int(combo), last_used)
+        self.sweep()
+        while len(self._combos) > self.max_size:
+            self._combos.popitem(last=False)
+        self._notify(was_active)